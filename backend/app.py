@@ -1,28 +1,35 @@
 import os
+import json
 import uuid
+import tempfile
 import uvicorn
-import psycopg2
-from psycopg2 import sql
-from utils import Chat
+from utils import AChat, AStreamChat, RetrievalStatus
 from typing import Optional
-from datetime import datetime
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langchain_community.graphs import Neo4jGraph
 from fastapi.security import OAuth2PasswordRequestForm
-from langchain_community.vectorstores import Neo4jVector
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query, Depends, status
-from data_processing import embedding_model, process_file, process_batches, clear_database
+from data_processing import process_file, process_batches, clear_database
+from pdf_parsing import shutdown_pdf_pool
+from resources import RESOURCE_WARMUP, resources
+from graph_writer import ensure_graph_schema
+from jobs import JobManager
+from chain_registry import ChainRegistry
+from entity_matcher import ENTITY_MATCHER_ENABLED, entity_matcher
+from caching import retrieval_cache
+from semantic_cache import SEMANTIC_CACHE_ENABLED, SemanticCache
+from memory import ConversationMemory
+from transcript_log import TranscriptLogger
+from db import init_pool, close_pool, acquire, check_health, pool_metrics
 from auth.models import UserCreate, User, Token
-from auth.security import verify_password, get_password_hash, create_access_token
-from auth.dependencies import get_current_user
+from auth.security import averify_password, aget_password_hash, create_access_token, hash_executor
+from auth.dependencies import get_current_user, invalidate_user, principal_cache
 from auth.database import (
-    get_db_connection,
     create_user_table,
     create_user,
-    check_user_exists,
     get_user_by_username
 )
 
@@ -31,71 +38,48 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 # Load environment variables
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
-PG_HOST = os.getenv("PG_HOST")
-PG_PORT = os.getenv("PG_PORT")
-PG_DBNAME = os.getenv("PG_DBNAME")
-PG_USER = os.getenv("PG_USER")
-PG_PASSWORD = os.getenv("PG_PASSWORD")
-
-
-# Initialize components
-embeddModel = embedding_model()
-
-graph = Neo4jGraph(
-    url=NEO4J_URI,
-    username=NEO4J_USERNAME,
-    password=NEO4J_PASSWORD
-)
 
-vector_index = Neo4jVector.from_existing_graph(
-    embeddModel,
-    search_type="hybrid",
-    node_label="Document",
-    text_node_properties=["text"],
-    embedding_node_property="embedding"
-)
+# Models and graph clients come from `resources`, built lazily or by the warm-up
+# RAG pipelines and Groq clients, built once per (model, API key)
+chain_registry = ChainRegistry(resources, entity_matcher if ENTITY_MATCHER_ENABLED else None)
 
-# Connect to PostgreSQL
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=PG_HOST,
-        port=PG_PORT,
-        dbname=PG_DBNAME,
-        user=PG_USER,
-        password=PG_PASSWORD
-    )
-    return conn
-
-# Function to create the database if it doesn't exist
-def create_database():
-    try:
-        conn = get_db_connection()
-        conn.autocommit = True
-        print(f"Database '{PG_DBNAME}' connected successfully.")
-        conn.close()
-    except Exception as e:
-        print(f"Error connecting to database: {e}")
+# Answers of earlier, semantically equivalent questions
+semantic_cache = SemanticCache(resources.query_embeddings) if SEMANTIC_CACHE_ENABLED else None
 
 # Function to create the table
-def create_table():
+async def create_table():
     create_table_query = """
     CREATE TABLE IF NOT EXISTS agentpro_db (
-        session_id UUID PRIMARY KEY,
+        id BIGSERIAL PRIMARY KEY,
+        user_id UUID,
+        session_id UUID NOT NULL,
         question TEXT NOT NULL,
         answer TEXT NOT NULL,
         timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
     """
+    # Older tables keyed rows by session_id, which allowed one turn per session
+    migrate_table_query = """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'agentpro_db' AND column_name = 'id'
+        ) THEN
+            ALTER TABLE agentpro_db DROP CONSTRAINT IF EXISTS agentpro_db_pkey;
+            ALTER TABLE agentpro_db ADD COLUMN id BIGSERIAL PRIMARY KEY;
+        END IF;
+    END $$;
+    -- Turns are owned by the user who asked them; older rows stay unowned
+    ALTER TABLE agentpro_db ADD COLUMN IF NOT EXISTS user_id UUID;
+    DROP INDEX IF EXISTS agentpro_db_session_idx;
+    CREATE INDEX IF NOT EXISTS agentpro_db_user_session_idx ON agentpro_db (user_id, session_id, timestamp);
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(create_table_query)
-        conn.commit()
-        cursor.close()
-        conn.close()
+        async with acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(create_table_query)
+                await conn.execute(migrate_table_query)
         print("Table created successfully or already exists.")
     except Exception as e:
         print(f"Error creating table: {e}")
@@ -118,6 +102,7 @@ class ChatRequest(BaseModel):
 
 class ChatResponse(BaseModel):
     response: str
+    session_id: Optional[str] = None
 
 # Model for process request with optional code (defaults to None)
 class ProcessRequest(BaseModel):
@@ -127,20 +112,21 @@ class ProcessRequest(BaseModel):
 
 @app.post("/signup", response_model=User)
 async def signup(user: UserCreate):
-    if check_user_exists(user.username, user.email):
+    hashed_password = await aget_password_hash(user.password)
+    # The unique constraints reject taken usernames and emails in the same round trip
+    user_id = await create_user(user.username, user.email, hashed_password)
+    if user_id is None:
         raise HTTPException(
             status_code=400,
             detail="Username or email already registered"
         )
-    
-    hashed_password = get_password_hash(user.password)
-    user_id = create_user(user.username, user.email, hashed_password)
-    return User(id=user_id, username=user.username, email=user.email)
+    invalidate_user(user.username)
+    return User(id=str(user_id), username=user.username, email=user.email)
 
 @app.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = get_user_by_username(form_data.username)
-    if not user or not verify_password(form_data.password, user[3]):
+    user = await get_user_by_username(form_data.username)
+    if not user or not await averify_password(form_data.password, user[3]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -150,8 +136,46 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     access_token = create_access_token(data={"sub": user[1]})
     return Token(access_token=access_token, token_type="bearer")
 
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+
+def resolve_model(model: Optional[str], groq_api_key: Optional[str]):
+    """Pick the requested model and API key, falling back to the defaults."""
+    model_name = model if model else DEFAULT_MODEL
+
+    if not model_name:
+        raise HTTPException(status_code=400, detail="Model is required and not provided.")
+    # If the user provides the groq_api_key in the query, use it, else use the default one from the .env file
+    api_key_to_use = groq_api_key if groq_api_key else GROQ_API_KEY
+
+    if not api_key_to_use:
+        raise HTTPException(status_code=400, detail="Groq API key is required and not provided.")
+    return model_name, api_key_to_use
+
+async def load_turns(user_id: str, session_id: str, limit: int):
+    """Most recent (question, answer) pairs of a user's session, oldest first."""
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT question, answer FROM agentpro_db WHERE user_id = $1 AND session_id = $2 "
+            "ORDER BY timestamp DESC, id DESC LIMIT $3",
+            user_id, session_id, limit
+        )
+    return [(row["question"], row["answer"]) for row in reversed(rows)]
+
+# Recent turns and rolling summaries per session, for follow-up questions
+conversation_memory = ConversationMemory(load_turns)
+
+# Transcript rows are buffered and written to PostgreSQL in batches
+transcript_logger = TranscriptLogger()
+
+async def semantic_lookup(question: str, model_name: str, chat_history, summary):
+    """Cached answer for a standalone question; embedding runs off the event loop."""
+    if semantic_cache is None or chat_history or summary:
+        return None, None
+    generation = semantic_cache.current_generation()
+    return await run_in_threadpool(semantic_cache.lookup, question, model_name), generation
+
 @app.post("/chat", response_model=ChatResponse)
-def ask_question(
+async def ask_question(
     request: ChatRequest,
     current_user: User = Depends(get_current_user),
     model: Optional[str] = Query(None),
@@ -159,58 +183,109 @@ def ask_question(
 ):
     """Endpoint to handle chatbot queries."""
     try:
-        DEFAULT_MODEL = "llama-3.1-8b-instant"
-        model_name = model if model else DEFAULT_MODEL
-        
-        if not model_name:
-            raise HTTPException(status_code=400, detail="Model is required and not provided.")
-        # If the user provides the groq_api_key in the query, use it, else use the default one from the .env file
-        api_key_to_use = groq_api_key if groq_api_key else GROQ_API_KEY
-        
-        if not api_key_to_use:
-            raise HTTPException(status_code=400, detail="Groq API key is required and not provided.")
+        model_name, api_key_to_use = resolve_model(model, groq_api_key)
 
         # Generate a new session ID if none is provided
         session_id = request.session_id or str(uuid.uuid4())
+        async with chain_registry.lease(model_name, api_key_to_use) as entry:
+            chat_history, summary = await conversation_memory.context(current_user.id, session_id, entry.llm) if request.session_id else ([], "")
 
-        # Process the question using Chat with the selected API key
-        response = Chat(
-            graph=graph,
-            llm=ChatGroq(groq_api_key=api_key_to_use, model_name = model_name),  # Pass the API key here
-            embedding=embeddModel,
-            vector_index=vector_index,
-            question=request.question,
-        )
-        print(response)
-        # Insert session data into PostgreSQL
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        query = sql.SQL("INSERT INTO agentpro_db (session_id, question, answer, timestamp) VALUES (%s, %s, %s, %s)")
-        cursor.execute(query, (session_id, request.question, response, datetime.now()))
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        return ChatResponse(response=response)
+            # Reuse the answer of a near-duplicate standalone question, else run the
+            # cached chain for the selected model and API key
+            response, generation = await semantic_lookup(request.question, model_name, chat_history, summary)
+            if response is None:
+                retrieval = RetrievalStatus()
+                response = await AChat(entry.chain, request.question, chat_history, summary, retrieval)
+                # Answers built on partial context must not be reused for paraphrases
+                if generation is not None and retrieval.complete and not response.startswith("Error:"):
+                    await run_in_threadpool(semantic_cache.store, request.question, model_name, response, generation)
+            print(response)
+            await transcript_logger.log(current_user.id, session_id, request.question, response)
+            await conversation_memory.record(current_user.id, session_id, request.question, response, entry.llm)
+
+        return ChatResponse(response=response, session_id=session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def ask_question_stream(
+    request: ChatRequest,
+    current_user: User = Depends(get_current_user),
+    model: Optional[str] = Query(None),
+    groq_api_key: Optional[str] = Query(None)
+):
+    """Endpoint to stream chatbot answers token by token as server-sent events."""
+    model_name, api_key_to_use = resolve_model(model, groq_api_key)
+    session_id = request.session_id or str(uuid.uuid4())
+
+    async def generate():
+        tokens = []
+        try:
+            async with chain_registry.lease(model_name, api_key_to_use) as entry:
+                chat_history, summary = await conversation_memory.context(current_user.id, session_id, entry.llm) if request.session_id else ([], "")
+                cached, generation = await semantic_lookup(request.question, model_name, chat_history, summary)
+                if cached is not None:
+                    tokens.append(cached)
+                    yield sse_event({"token": cached})
+                else:
+                    retrieval = RetrievalStatus()
+                    async for token in AStreamChat(entry.chain, request.question, chat_history, summary, retrieval):
+                        tokens.append(token)
+                        yield sse_event({"token": token})
+                    if generation is not None and retrieval.complete:
+                        await run_in_threadpool(semantic_cache.store, request.question, model_name, "".join(tokens), generation)
+                # Log once the full answer is known
+                answer = "".join(tokens)
+                await transcript_logger.log(current_user.id, session_id, request.question, answer)
+                await conversation_memory.record(current_user.id, session_id, request.question, answer, entry.llm)
+                yield sse_event({"session_id": session_id}, event="done")
+        except Exception as e:
+            yield sse_event({"detail": str(e)}, event="error")
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Endpoint to report hit/miss counts of the answer, retrieval, embedding and principal caches."""
+    return {
+        "semantic": semantic_cache.stats() if semantic_cache else None,
+        "retrieval": retrieval_cache.cache.stats(),
+        "query_embedding": resources.query_embeddings.cache.stats(),
+        "principal": principal_cache.stats(),
+    }
+
+@app.get("/ready")
+def ready():
+    """Endpoint to report which shared resources are warm (503 until warm-up finishes)."""
+    body = {"ready": resources.ready(), "resources": resources.status()}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/embeddings/stats")
+def embedding_stats():
+    """Endpoint to report batching and fp32 accuracy-check counters of the embedding engine."""
+    return {"engine": resources.embedding_stats()}
+
 @app.get("/")
 def read_root():
     """Root endpoint."""
     return {"message": "Welcome to the ChatBot API!"}
 
-@app.post("/process")
-async def process_data(file: UploadFile = File(...), code: Optional[str] = Form(None)):  # Explicitly get `code` from form-data
-    """Endpoint to process file, clear database, and process batches."""
-    try:
-        # Save the uploaded file temporarily
-        file_path = f"{file.filename}"
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
+# Bounded pool that runs ingestion in the background
+job_manager = JobManager()
+
+# Size of each read when spooling an upload to disk
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
+
+def run_ingestion(job, file_path: str, code: Optional[str]):
+    """Clear (if requested), parse and ingest an uploaded file, then remove it."""
+    try:
         # Clear the database if a code is provided
-        print(code)
         if code is not None:
             print("Clearing database with code...")
             clear_database(code)
@@ -218,19 +293,74 @@ async def process_data(file: UploadFile = File(...), code: Optional[str] = Form(
         # Process the file
         documents = process_file(file_path)
         # Process documents in batches
-        process_batches(documents)
+        process_batches(job.track(documents), progress=job)
+    finally:
         os.remove(file_path)
-        return {"message": "Task completed successfully."}
+
+@app.post("/process")
+async def process_data(file: UploadFile = File(...), code: Optional[str] = Form(None)):  # Explicitly get `code` from form-data
+    """Endpoint to spool an upload to disk and queue it for background ingestion."""
+    try:
+        # Stream the upload to a temporary spool file without holding it in memory
+        suffix = os.path.splitext(file.filename or "")[1]
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as spool:
+            file_path = spool.name
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                spool.write(chunk)
+
+        job = job_manager.submit(file.filename, lambda job: run_ingestion(job, file_path, code))
+        return {"message": "Task queued.", "job_id": job.id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/process/{job_id}")
+def process_status(job_id: str):
+    """Endpoint to report progress of a background ingestion job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/db/stats")
+async def db_stats():
+    """Endpoint to report connection pool health and saturation."""
+    await check_health()
+    return {**pool_metrics(), "transcripts": transcript_logger.stats()}
+
+def prepare_graph():
+    """Create graph constraints and index entity ids for question matching."""
+    ensure_graph_schema(resources.driver)
+    if ENTITY_MATCHER_ENABLED:
+        entity_matcher.load(resources.graph)
+
 # Startup event to create the database and table
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     """Runs at application startup."""
-    create_database()
-    create_table()
-    create_user_table()
+    await init_pool()
+    await create_table()
+    await create_user_table()
+    await transcript_logger.start()
+    # Built here so the async driver belongs to the running event loop
+    resources.async_driver
+    if RESOURCE_WARMUP:
+        resources.on_warm(prepare_graph)
+        resources.start_warmup()
+    else:
+        await run_in_threadpool(prepare_graph)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Runs at application shutdown."""
+    job_manager.shutdown()
+    shutdown_pdf_pool()
+    hash_executor.shutdown(wait=False)
+    await chain_registry.aclose()
+    await resources.aclose()
+    await transcript_logger.close()
+    await close_pool()
+    if semantic_cache:
+        semantic_cache.close()
 
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=5507, reload=True)
@@ -1,20 +1,8 @@
 # auth/database.py
-import os
-import psycopg2
-from psycopg2 import sql
 import uuid
-from datetime import datetime
+from db import acquire
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv("PG_HOST"),
-        port=os.getenv("PG_PORT"),
-        dbname=os.getenv("PG_DBNAME"),
-        user=os.getenv("PG_USER"),
-        password=os.getenv("PG_PASSWORD")
-    )
-
-def create_user_table():
+async def create_user_table():
     create_table_query = """
     CREATE TABLE IF NOT EXISTS users (
         id UUID PRIMARY KEY,
@@ -25,49 +13,25 @@ def create_user_table():
     );
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(create_table_query)
-        conn.commit()
-        cursor.close()
-        conn.close()
+        async with acquire() as conn:
+            await conn.execute(create_table_query)
         print("Users table created successfully or already exists.")
     except Exception as e:
         print(f"Error creating users table: {e}")
 
-def get_user_by_username(username: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, username, email, password_hash FROM users WHERE username = %s",
-        (username,)
-    )
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    return user
+async def get_user_by_username(username: str):
+    async with acquire() as conn:
+        return await conn.fetchrow(
+            "SELECT id, username, email, password_hash FROM users WHERE username = $1",
+            username
+        )
 
-def create_user(username: str, email: str, password_hash: str):
+async def create_user(username: str, email: str, password_hash: str):
+    """Insert a user; returns None if the username or email is already taken."""
     user_id = str(uuid.uuid4())
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO users (id, username, email, password_hash) VALUES (%s, %s, %s, %s)",
-        (user_id, username, email, password_hash)
-    )
-    conn.commit()
-    cursor.close()
-    conn.close()
-    return user_id
-
-def check_user_exists(username: str, email: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT username FROM users WHERE username = %s OR email = %s",
-        (username, email)
-    )
-    exists = cursor.fetchone() is not None
-    cursor.close()
-    conn.close()
-    return exists
\ No newline at end of file
+    async with acquire() as conn:
+        return await conn.fetchval(
+            "INSERT INTO users (id, username, email, password_hash) VALUES ($1, $2, $3, $4) "
+            "ON CONFLICT DO NOTHING RETURNING id",
+            user_id, username, email, password_hash
+        )
@@ -1,13 +1,30 @@
+import os
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from caching import TTLCache
 from .models import User, TokenData
 from .database import get_user_by_username
 from .security import SECRET_KEY, ALGORITHM
 
+# Verified principals keyed by token; an entry never outlives the token's exp
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+def invalidate_user(username: str) -> int:
+    """Forget cached principals of a user, e.g. after their account changed."""
+    return principal_cache.discard_where(lambda token, user: user.username == username)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    cached = principal_cache.get(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -22,7 +39,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    user = get_user_by_username(token_data.username)
+    user = await get_user_by_username(token_data.username)
     if user is None:
         raise credentials_exception
-    return User(id=str(user[0]), username=user[1], email=user[2])
+    principal = User(id=str(user[0]), username=user[1], email=user[2])
+    expires_in = payload["exp"] - time.time() if "exp" in payload else None
+    if expires_in is None or expires_in > 0:
+        principal_cache.set(token, principal, ttl=expires_in)
+    return principal
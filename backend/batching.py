@@ -0,0 +1,62 @@
+import os
+import threading
+from typing import Callable, Iterable, Iterator, List
+from langchain.schema import Document
+
+# Upper bound on chunks per extraction call and on the chunk text sent in one call
+EXTRACTION_BATCH_SIZE = int(os.getenv("EXTRACTION_BATCH_SIZE", "8"))
+EXTRACTION_MAX_INPUT_TOKENS = int(os.getenv("EXTRACTION_MAX_INPUT_TOKENS", "3000"))
+# Consecutive successful batches needed before the batch size grows back by one
+EXTRACTION_GROW_AFTER = int(os.getenv("EXTRACTION_GROW_AFTER", "4"))
+
+
+def approximate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+class AdaptiveBatcher:
+    """Group chunks into extraction batches bounded by count and token budget.
+
+    The batch size halves whenever a batch fails and creeps back up by one
+    after a run of successes, so a model that chokes on large inputs settles
+    on the largest batch it can reliably handle.
+    """
+
+    def __init__(
+        self,
+        max_size: int = EXTRACTION_BATCH_SIZE,
+        max_tokens: int = EXTRACTION_MAX_INPUT_TOKENS,
+        count_tokens: Callable[[str], int] = approximate_tokens,
+    ):
+        self.max_size = max(1, max_size)
+        self.size = self.max_size
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.successes = 0
+        self.lock = threading.Lock()
+
+    def shrink(self):
+        with self.lock:
+            self.size = max(1, self.size // 2)
+            self.successes = 0
+
+    def grow(self):
+        with self.lock:
+            self.successes += 1
+            if self.successes >= EXTRACTION_GROW_AFTER and self.size < self.max_size:
+                self.size += 1
+                self.successes = 0
+
+    def batches(self, documents: Iterable[Document]) -> Iterator[List[Document]]:
+        """Lazily yield lists of documents; the current size is read per batch."""
+        batch, tokens = [], 0
+        for doc in documents:
+            doc_tokens = self.count_tokens(doc.page_content)
+            if batch and (len(batch) >= self.size or tokens + doc_tokens > self.max_tokens):
+                yield batch
+                batch, tokens = [], 0
+            batch.append(doc)
+            tokens += doc_tokens
+        if batch:
+            yield batch
@@ -0,0 +1,141 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+from langchain_core.embeddings import Embeddings
+
+# Question-embedding cache (embeddings never go stale, so only size and TTL bound it)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+# Retrieved-context cache, additionally keyed by the graph generation
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "600"))
+
+_MISSING = object()
+
+
+def normalize_question(text: str) -> str:
+    """Case- and whitespace-insensitive cache key for a question."""
+    return re.sub(r"\s+", " ", text.strip().lower()).rstrip("?!. ")
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not _MISSING:
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store `value`; `ttl` shortens (never extends) the default lifetime."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Drop every entry for which `predicate(key, value)` holds."""
+        with self.lock:
+            keys = [key for key, (_, value) in self.entries.items() if predicate(key, value)]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class GraphGeneration:
+    """Counter bumped on every graph change; caches key their entries by it."""
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def bump(self):
+        with self.lock:
+            self.value += 1
+        for listener in self.listeners:
+            listener()
+
+    def on_bump(self, listener):
+        self.listeners.append(listener)
+
+
+# Bumped by ingestion and clear_database
+graph_generation = GraphGeneration()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an embedding model so repeated queries skip the forward pass."""
+
+    def __init__(self, embeddings: Embeddings, cache: Optional[TTLCache] = None):
+        self.embeddings = embeddings
+        self.cache = cache or TTLCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL_SECONDS)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_question(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_question(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+
+class RetrievalCache:
+    """Cache of full retriever output keyed by question and graph generation."""
+
+    def __init__(self, generation: GraphGeneration = graph_generation):
+        self.generation = generation
+        self.cache = TTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL_SECONDS)
+        # Entries for old generations can never hit again; free them eagerly
+        generation.on_bump(self.cache.clear)
+
+    def get(self, question: str) -> Optional[str]:
+        return self.cache.get((normalize_question(question), self.generation.value))
+
+    def set(self, question: str, context: str, generation: int):
+        # Store under the generation the retrieval started in, so a change
+        # that landed mid-retrieval is never hidden behind a fresh key
+        self.cache.set((normalize_question(question), generation), context)
+
+
+# Shared by every chain so all models benefit from the same retrievals
+retrieval_cache = RetrievalCache()
@@ -0,0 +1,143 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List, Tuple
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from langchain_groq import ChatGroq
+from utils import build_chain
+from context_assembler import context_budget
+
+# Number of (model, API key) pipelines kept warm
+CHAIN_CACHE_SIZE = int(os.getenv("CHAIN_CACHE_SIZE", "16"))
+# Keep-alive settings for the HTTP connections of each Groq client
+GROQ_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GROQ_MAX_KEEPALIVE_CONNECTIONS", "20"))
+GROQ_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("GROQ_KEEPALIVE_EXPIRY_SECONDS", "120"))
+# How long an evicted, unused entry stays open for work detached from its
+# request (background summaries) before its HTTP clients are closed
+CHAIN_RETIRE_GRACE_SECONDS = float(os.getenv("CHAIN_RETIRE_GRACE_SECONDS", "60"))
+
+
+class ChainEntry:
+    """An LLM client, its HTTP connection pools and the RAG chain built on it."""
+
+    def __init__(self, llm, chain, http_client, http_async_client):
+        self.llm = llm
+        self.chain = chain
+        self.http_client = http_client
+        self.http_async_client = http_async_client
+        # Requests currently holding a lease, and when the LRU evicted the entry
+        self.users = 0
+        self.retired_at = None
+
+    async def aclose(self):
+        self.http_client.close()
+        await self.http_async_client.aclose()
+
+
+class ChainRegistry:
+    """Build each RAG pipeline once per (model name, API key) and reuse it.
+
+    Entries live in a bounded LRU. The async driver and vector index come
+    from the shared `resources` container and are resolved on first build.
+    Each Groq client gets its own httpx clients with keep-alive enabled, so
+    requests reuse open TLS connections. Requests use an entry through
+    `lease`; evicted entries are closed once no lease holds them and the
+    retire grace period has passed.
+    """
+
+    def __init__(self, resources, entity_matcher=None, max_size: int = CHAIN_CACHE_SIZE):
+        self.resources = resources
+        self.entity_matcher = entity_matcher
+        self.max_size = max_size
+        self.entries: "OrderedDict[Tuple[str, str], ChainEntry]" = OrderedDict()
+        self.retired: List[ChainEntry] = []
+        self.lock = threading.Lock()
+
+    def _build(self, model_name: str, api_key: str) -> ChainEntry:
+        limits = httpx.Limits(
+            max_keepalive_connections=GROQ_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GROQ_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        http_client = httpx.Client(limits=limits)
+        http_async_client = httpx.AsyncClient(limits=limits)
+        llm = ChatGroq(
+            groq_api_key=api_key,
+            model_name=model_name,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        )
+        chain = build_chain(
+            llm,
+            self.resources.vector_index,
+            self.resources.async_driver,
+            self.entity_matcher,
+            token_budget=context_budget(model_name),
+        )
+        return ChainEntry(llm, chain, http_client, http_async_client)
+
+    def get(self, model_name: str, api_key: str) -> ChainEntry:
+        key = (model_name, api_key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        # Build outside the lock; if two requests race, the first one stored wins
+        entry = self._build(model_name, api_key)
+        with self.lock:
+            existing = self.entries.get(key)
+            if existing is not None:
+                self.entries.move_to_end(key)
+                return existing
+            self.entries[key] = entry
+            # A request may still be using an evicted entry; `reap` closes it later
+            while len(self.entries) > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                evicted.retired_at = time.monotonic()
+                self.retired.append(evicted)
+        return entry
+
+    @asynccontextmanager
+    async def lease(self, model_name: str, api_key: str):
+        """Hold an entry for the duration of a request."""
+        key = (model_name, api_key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                entry.users += 1
+        if entry is None:
+            # A first build may load models and connect to Neo4j, so keep it off the event loop
+            entry = await run_in_threadpool(self.get, model_name, api_key)
+            with self.lock:
+                entry.users += 1
+        try:
+            yield entry
+        finally:
+            with self.lock:
+                entry.users -= 1
+            await self.reap()
+
+    async def reap(self):
+        """Close evicted entries that are unused and past the grace period."""
+        now = time.monotonic()
+        with self.lock:
+            done = [
+                entry for entry in self.retired
+                if entry.users == 0 and now - entry.retired_at >= CHAIN_RETIRE_GRACE_SECONDS
+            ]
+            self.retired = [entry for entry in self.retired if entry not in done]
+        for entry in done:
+            await entry.aclose()
+
+    async def aclose(self):
+        """Close all pooled HTTP connections (called at shutdown)."""
+        with self.lock:
+            entries = list(self.entries.values()) + self.retired
+            self.entries.clear()
+            self.retired = []
+        for entry in entries:
+            await entry.aclose()
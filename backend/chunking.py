@@ -0,0 +1,209 @@
+import os
+import re
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+from transformers import AutoTokenizer
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from extraction_cache import content_hash
+
+# Token budget per chunk, the smallest section worth its own chunk, and overlap
+# used only when a single oversized paragraph has to be split
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "512"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "128"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Local tokenizer (the gte-large folder written by gteModel.py at image build),
+# so token counting never needs network access; chunks also match the
+# embedding model's own 512-token window
+CHUNK_TOKENIZER_PATH = os.getenv("CHUNK_TOKENIZER_PATH", "GeneralTextEmbeddingModel")
+# Attach the markdown heading path of each chunk as `section` metadata
+CHUNK_SECTION_METADATA = os.getenv("CHUNK_SECTION_METADATA", "true").lower() == "true"
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+@lru_cache(maxsize=None)
+def getget_tokenizer():
+    """The shared counting tokenizer, loaded on first use (or by the resource warm-up)."""
+    tokenizer = AutoTokenizer.from_pretrained(CHUNK_TOKENIZER_PATH, local_files_only=True)
+    # Only counting here; silence the "sequence longer than 512" warning
+    tokenizer.model_max_length = int(1e9)
+    return tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokenizer tokens in `text`."""
+    return len(get_tokenizer().encode(text, add_special_tokens=False))
+
+
+@lru_cache(maxsize=None)
+def _paragraph_splitter(chunk_tokens: int, overlap_tokens: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        get_tokenizer(),
+        chunk_size=chunk_tokens,
+        chunk_overlap=overlap_tokens,
+    )
+
+
+def iter_blocks(markdown: str) -> Iterator[Tuple[str, str]]:
+    """Split markdown into ("heading" | "table" | "code" | "text", block) pairs."""
+    kind, lines = None, []
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        if kind == "code":
+            lines.append(line)
+            if stripped.startswith("```"):
+                yield kind, "\n".join(lines)
+                kind, lines = None, []
+            continue
+        if stripped.startswith("```"):
+            if lines:
+                yield kind, "\n".join(lines)
+            kind, lines = "code", [line]
+        elif HEADING_RE.match(stripped):
+            if lines:
+                yield kind, "\n".join(lines)
+                kind, lines = None, []
+            yield "heading", stripped
+        elif stripped.startswith("|"):
+            if kind != "table" and lines:
+                yield kind, "\n".join(lines)
+                lines = []
+            kind = "table"
+            lines.append(line)
+        elif not stripped:
+            if lines:
+                yield kind, "\n".join(lines)
+            kind, lines = None, []
+        else:
+            if kind == "table" and lines:
+                yield kind, "\n".join(lines)
+                lines = []
+            kind = "text"
+            lines.append(line)
+    if lines:
+        yield kind, "\n".join(lines)
+
+
+class MarkdownChunker:
+    """Pack markdown sections, paragraphs and tables into token-budgeted chunks.
+
+    Blocks are accumulated until the budget is reached; a new heading closes
+    the current chunk once it holds at least `min_tokens`, so small sections
+    are merged instead of becoming tiny chunks. A heading is never emitted
+    on its own: if the next block does not fit beside it, the heading moves
+    to the next chunk with that block. Oversized tables are split by rows
+    (repeating their header) and oversized paragraphs by the recursive
+    splitter, leaving room for the pending headings. `feed` may be called
+    repeatedly with consecutive pieces of one document; the heading path and
+    any partial chunk carry over.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = CHUNK_TOKENS,
+        min_tokens: int = CHUNK_MIN_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        section_metadata: bool = CHUNK_SECTION_METADATA,
+    ):
+        self.chunk_tokens = chunk_tokens
+        self.min_tokens = min_tokens
+        self.overlap_tokens = overlap_tokens
+        self.section_metadata = section_metadata
+        self.headings: List[Tuple[int, str]] = []
+        self.parts: List[str] = []
+        self.tokens = 0
+        self.section: Optional[str] = None
+        # Headings at the end of `parts` with no content after them yet
+        self.heading_parts = 0
+        self.heading_tokens = 0
+
+    def _section_path(self) -> str:
+        return " > ".join(title for _, title in self.headings)
+
+    def _emit(self) -> Iterator[Document]:
+        if self.parts:
+            text = "\n\n".join(self.parts)
+            metadata = {"id": content_hash(text)}
+            if self.section_metadata and self.section:
+                metadata["section"] = self.section
+            yield Document(page_content=text, metadata=metadata)
+        self.parts, self.tokens, self.section = [], 0, None
+        self.heading_parts, self.heading_tokens = 0, 0
+
+    def _close(self) -> Iterator[Document]:
+        """Emit the current chunk, carrying trailing headings into the next one."""
+        if self.heading_parts == len(self.parts):
+            return
+        carried = self.parts[len(self.parts) - self.heading_parts:] if self.heading_parts else []
+        carried_tokens = self.heading_tokens
+        self.parts = self.parts[:len(self.parts) - len(carried)]
+        yield from self._emit()
+        if carried:
+            self.parts, self.tokens = carried, carried_tokens
+            self.heading_parts, self.heading_tokens = len(carried), carried_tokens
+            self.section = self._section_path()
+
+    def _add(self, block: str, tokens: int, heading: bool = False) -> Iterator[Document]:
+        if self.parts and self.tokens + tokens > self.chunk_tokens:
+            yield from self._close()
+        if not self.parts:
+            self.section = self._section_path()
+        self.parts.append(block)
+        self.tokens += tokens
+        if heading:
+            self.heading_parts += 1
+            self.heading_tokens += tokens
+        else:
+            self.heading_parts, self.heading_tokens = 0, 0
+
+    def _piece_budget(self) -> int:
+        """Tokens left for split pieces beside the headings they will be attached to."""
+        return max(self.chunk_tokens - self.heading_tokens, self.chunk_tokens // 2)
+
+    def _split_table(self, table: str, budget: int) -> List[str]:
+        rows = table.splitlines()
+        header, body = rows[:2], rows[2:]
+        header_tokens = count_tokens("\n".join(header))
+        pieces, current, tokens = [], [], header_tokens
+        for row in body:
+            row_tokens = count_tokens(row)
+            if current and tokens + row_tokens > budget:
+                pieces.append("\n".join(header + current))
+                current, tokens = [], header_tokens
+            current.append(row)
+            tokens += row_tokens
+        if current or not pieces:
+            pieces.append("\n".join(header + current))
+        return pieces
+
+    def feed(self, markdown: str) -> Iterator[Document]:
+        for kind, block in iter_blocks(markdown):
+            if kind == "heading":
+                level = len(HEADING_RE.match(block).group(1))
+                if self.tokens - self.heading_tokens >= self.min_tokens:
+                    yield from self._close()
+                self.headings = [(lvl, title) for lvl, title in self.headings if lvl < level]
+                self.headings.append((level, HEADING_RE.match(block).group(2)))
+                yield from self._add(block, count_tokens(block), heading=True)
+                continue
+            tokens = count_tokens(block)
+            budget = self._piece_budget()
+            if tokens <= budget:
+                yield from self._add(block, tokens)
+            elif kind == "table":
+                for piece in self._split_table(block, budget):
+                    yield from self._add(piece, count_tokens(piece))
+            else:
+                splitter = _paragraph_splitter(budget, self.overlap_tokens)
+                for piece in splitter.split_text(block):
+                    yield from self._add(piece, count_tokens(piece))
+
+    def finish(self) -> Iterator[Document]:
+        yield from self._emit()
+
+
+def chunk_markdown(markdown: str, **kwargs) -> List[Document]:
+    """Chunk a complete markdown document."""
+    chunker = MarkdownChunker(**kwargs)
+    return list(chunker.feed(markdown)) + list(chunker.finish())
@@ -0,0 +1,110 @@
+import os
+import re
+from typing import Dict, List, Optional
+from chunking import count_tokens
+
+# Context tokens allowed in the final prompt, per model (CONTEXT_TOKEN_BUDGET overrides all).
+# Counted with the local gte-large WordPiece tokenizer, which yields more
+# tokens than the Groq models' tokenizers for the same text, so budgets err low.
+MODEL_CONTEXT_BUDGETS: Dict[str, int] = {
+    "llama-3.1-8b-instant": 2500,
+    "llama-3.3-70b-versatile": 6000,
+    "mixtral-8x7b-32768": 6000,
+    "gemma2-9b-it": 3000,
+}
+DEFAULT_CONTEXT_TOKEN_BUDGET = 4000
+CONTEXT_TOKEN_BUDGET = os.getenv("CONTEXT_TOKEN_BUDGET")
+# Chunks sharing at least this fraction of their words with a kept chunk are dropped
+CONTEXT_OVERLAP_THRESHOLD = float(os.getenv("CONTEXT_OVERLAP_THRESHOLD", "0.8"))
+
+WORD_RE = re.compile(r"\w+")
+
+
+def context_budget(model_name: str) -> int:
+    if CONTEXT_TOKEN_BUDGET:
+        return int(CONTEXT_TOKEN_BUDGET)
+    return MODEL_CONTEXT_BUDGETS.get(model_name, DEFAULT_CONTEXT_TOKEN_BUDGET)
+
+
+def _words(text: str) -> set:
+    return set(WORD_RE.findall(text.lower()))
+
+
+class AssembledContext:
+    """The packed prompt context and what had to be left out."""
+
+    def __init__(self, text: str, items_used: int, items_dropped: int, tokens_used: int, tokens_dropped: int):
+        self.text = text
+        self.items_used = items_used
+        self.items_dropped = items_dropped
+        self.tokens_used = tokens_used
+        self.tokens_dropped = tokens_dropped
+
+
+def _dedupe_chunks(chunks: List[str]) -> List[str]:
+    """Drop repeated chunks and chunks mostly contained in an earlier one."""
+    kept, kept_words = [], []
+    for chunk in chunks:
+        words = _words(chunk)
+        if not words:
+            continue
+        duplicate = any(
+            len(words & other) / min(len(words), len(other)) >= CONTEXT_OVERLAP_THRESHOLD
+            for other in kept_words
+        )
+        if not duplicate:
+            kept.append(chunk)
+            kept_words.append(words)
+    return kept
+
+
+def assemble_context(
+    question: str,
+    triples: List[str],
+    chunks: List[str],
+    token_budget: Optional[int] = None,
+) -> AssembledContext:
+    """Deduplicate, rank and pack retrieved items into a token budget.
+
+    Items are scored by the share of question words they contain plus a
+    prior from their retrieval rank, then added best-first while they fit.
+    Kept items are rendered in their original order and layout.
+    """
+    token_budget = token_budget or DEFAULT_CONTEXT_TOKEN_BUDGET
+    question_words = _words(question)
+
+    unique_triples = list(dict.fromkeys(t.strip() for t in triples if t.strip()))
+    unique_chunks = _dedupe_chunks(chunks)
+    items_dropped = len(triples) - len(unique_triples) + len(chunks) - len(unique_chunks)
+
+    candidates = []
+    for kind, items in (("triple", unique_triples), ("chunk", unique_chunks)):
+        for rank, text in enumerate(items):
+            overlap = len(question_words & _words(text)) / len(question_words) if question_words else 0.0
+            candidates.append((overlap + 1.0 / (rank + 2), kind, rank, text, count_tokens(text)))
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    used_tokens, dropped_tokens = 0, 0
+    kept = {"triple": [], "chunk": []}
+    for _, kind, rank, text, tokens in candidates:
+        if used_tokens + tokens <= token_budget:
+            kept[kind].append((rank, text))
+            used_tokens += tokens
+        else:
+            items_dropped += 1
+            dropped_tokens += tokens
+
+    structured_data = "\n".join(text for _, text in sorted(kept["triple"]))
+    unstructured_data = [text for _, text in sorted(kept["chunk"])]
+    final_data = f"""Structured data:
+    {structured_data}
+    Unstructured data:
+    {"#Document ".join(unstructured_data)}
+    """
+    return AssembledContext(
+        final_data,
+        items_used=len(kept["triple"]) + len(kept["chunk"]),
+        items_dropped=items_dropped,
+        tokens_used=used_tokens,
+        tokens_dropped=dropped_tokens,
+    )
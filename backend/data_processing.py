@@ -1,18 +1,30 @@
 import os
 import csv
-import time
 import magic
-import pymupdf4llm
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
 from langchain_groq import ChatGroq
-from langchain_community.graphs import Neo4jGraph
-from langchain_community.vectorstores import Neo4jVector
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_experimental.graph_transformers import LLMGraphTransformer
-from neo4j import GraphDatabase
+from langchain_community.graphs.graph_document import GraphDocument
 from dotenv import load_dotenv
-from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from scheduler import ExtractionScheduler, is_rate_limit_error
+from batching import AdaptiveBatcher
+from chunking import MarkdownChunker, count_tokens
+from embedding_stage import EmbeddingStage
+from graph_writer import GraphWriter
+from pdf_parsing import iter_pdf_markdown
+from entity_matcher import entity_matcher
+from caching import graph_generation
+from resources import resources
+from extraction_cache import (
+    ExtractionCache,
+    cache_key,
+    content_hash,
+    get_extraction_cache,
+    graph_document_from_json,
+    graph_document_to_json,
+)
 
 # Load environment variables
 load_dotenv()
@@ -24,32 +36,28 @@ GROQ_API_KEYS = [
     os.getenv("GROQ_API_KEY_5"),
     os.getenv("GROQ_API_KEY_6"),
 ]
+GROQ_API_KEYS = [key for key in GROQ_API_KEYS if key]
 
-NEO4J_URI = os.getenv("NEO4J_URI")
-NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
-
-def embedding_model():
-    model = HuggingFaceEmbeddings(model_name="GeneralTextEmbeddingModel")
-    return model
 
-# Initialize embeddings and Neo4j driver
-embeddModel = embedding_model()
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-graph = Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD)
+# Model used for graph extraction; bump the prompt version whenever the
+# transformer configuration changes so stale cached extractions stop matching
+EXTRACTION_MODEL = os.getenv("EXTRACTION_MODEL", "llama-3.1-8b-instant")
+EXTRACTION_PROMPT_VERSION = os.getenv("EXTRACTION_PROMPT_VERSION", "1")
 
 
 def get_llm(api_key: str):
     """Initialize ChatGroq LLM with an API key."""
-    return ChatGroq(groq_api_key=api_key, model_name="llama-3.1-8b-instant")
+    return ChatGroq(groq_api_key=api_key, model_name=EXTRACTION_MODEL)
 
 
 def clear_database(CODE):
     """Clear all nodes and relationships in the Neo4j database."""
     if CODE == str(7179):
-        with driver.session() as session:
+        with resources.driver.session() as session:
             try:
                 session.write_transaction(lambda tx: tx.run("MATCH (n) DETACH DELETE n"))
+                graph_generation.bump()
+                entity_matcher.clear()
                 print("Database cleared successfully.")
             except Exception as e:
                 print(f"Error clearing database: {e}")
@@ -57,27 +65,57 @@ def clear_database(CODE):
         print("Your password is incorrect")
 
 
-def process_pdf(pdf_path: str) -> List[Document]:
-    """Convert PDF to a list of Documents."""
-    raw_text = pymupdf4llm.to_markdown(pdf_path)
-    return split_text_into_chunks(raw_text)
+def process_pdf(pdf_path: str) -> Iterator[Document]:
+    """Stream a PDF as Documents, converting page ranges in parallel."""
+    chunker = MarkdownChunker()
+    for markdown in iter_pdf_markdown(pdf_path):
+        yield from chunker.feed(markdown)
+    yield from chunker.finish()
+
+
+# Upper bound on characters per CSV chunk; rows only split when one alone exceeds it
+CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", "512"))
+
 
+def split_csv_row(line: str, size: int) -> List[str]:
+    """Split a row longer than `size` characters into pieces of at most `size`."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=0, separators=[",", " ", ""])
+    return splitter.split_text(line)
 
-def process_csv(csv_path: str) -> List[Document]:
-    """Convert CSV to a list of Documents."""
-    with open(csv_path, mode="r") as csvfile:
+
+def process_csv(csv_path: str) -> Iterator[Document]:
+    """Stream a CSV as Documents of whole rows, each prefixed with the header."""
+    with open(csv_path, mode="r", newline="") as csvfile:
         reader = csv.reader(csvfile)
-        header = next(reader)  # Read header
-        rows = [",".join(row) for row in reader]
-    text_data = "\n".join([",".join(header)] + rows)
-    return split_text_into_chunks(text_data)
+        header_row = next(reader, None)  # Read header
+        if header_row is None:
+            return
+        header = ",".join(header_row)
+        # Room left for rows beside the header (which every chunk repeats)
+        row_budget = max(CSV_CHUNK_SIZE - len(header) - 1, CSV_CHUNK_SIZE // 2)
+        rows, size = [], len(header)
+        for row in reader:
+            line = ",".join(row)
+            if len(line) > row_budget:
+                # Long rows (or long lines of a text file) get chunks of their own
+                if rows:
+                    yield make_csv_document(header, rows)
+                    rows, size = [], len(header)
+                for piece in split_csv_row(line, row_budget):
+                    yield make_csv_document(header, [piece])
+                continue
+            if rows and size + len(line) + 1 > CSV_CHUNK_SIZE:
+                yield make_csv_document(header, rows)
+                rows, size = [], len(header)
+            rows.append(line)
+            size += len(line) + 1
+        if rows:
+            yield make_csv_document(header, rows)
 
 
-def split_text_into_chunks(text: str) -> List[Document]:
-    """Split text into smaller chunks for processing."""
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=50)
-    chunks = text_splitter.split_text(text)
-    return [Document(page_content=chunk) for chunk in chunks]
+def make_csv_document(header: str, rows: List[str]) -> Document:
+    text = "\n".join([header] + rows)
+    return Document(page_content=text, metadata={"id": content_hash(text)})
 
 
 def detect_file_type(file_path: str) -> str:
@@ -86,8 +124,8 @@ def detect_file_type(file_path: str) -> str:
     return mime.from_file(file_path)
 
 
-def process_file(file_path: str) -> List[Document]:
-    """Determine file type and process accordingly."""
+def process_file(file_path: str) -> Iterable[Document]:
+    """Determine file type and process accordingly; Documents are produced lazily."""
     file_type = detect_file_type(file_path)
     if file_type == "text/plain" or file_type == "text/csv":
         return process_csv(file_path)
@@ -97,33 +135,235 @@ def process_file(file_path: str) -> List[Document]:
         raise ValueError(f"Unsupported file type: {file_type}")
 
 
-def add_documents_to_graph(documents: List[Document], transformer: LLMGraphTransformer):
-    """Add processed documents to the Neo4j graph."""
-    try:
-        batch_graph_docs = transformer.convert_to_graph_documents(documents)
-        graph.add_graph_documents(
-            batch_graph_docs,
-            baseEntityLabel=True,
-            include_source=True,
+def split_graph_document(graph_doc: GraphDocument, documents: List[Document]) -> Tuple[List[GraphDocument], Set[int]]:
+    """Attribute a graph extracted from several concatenated chunks back to each chunk.
+
+    Also returns the indices of chunks that were given nodes or relationships
+    by a fallback rather than by their own text; those splits depend on the
+    rest of the batch and must not be cached per chunk.
+    """
+    texts = [doc.page_content.lower() for doc in documents]
+    chunk_nodes = [dict() for _ in documents]
+    for node in graph_doc.nodes:
+        for i, text in enumerate(texts):
+            if str(node.id).lower() in text:
+                chunk_nodes[i][node.id] = node
+
+    fallback = set()
+    chunk_rels = [[] for _ in documents]
+    for rel in graph_doc.relationships:
+        placed = False
+        for i, nodes in enumerate(chunk_nodes):
+            if rel.source.id in nodes and rel.target.id in nodes:
+                chunk_rels[i].append(rel)
+                placed = True
+        if not placed:
+            # Fall back to the chunk that mentions either endpoint (or the first one)
+            i = next(
+                (i for i, nodes in enumerate(chunk_nodes) if rel.source.id in nodes or rel.target.id in nodes),
+                0,
+            )
+            chunk_nodes[i].setdefault(rel.source.id, rel.source)
+            chunk_nodes[i].setdefault(rel.target.id, rel.target)
+            chunk_rels[i].append(rel)
+            fallback.add(i)
+
+    # Nodes the LLM normalised beyond recognition still need a home
+    placed_ids = {node_id for nodes in chunk_nodes for node_id in nodes}
+    for node in graph_doc.nodes:
+        if node.id not in placed_ids:
+            chunk_nodes[0][node.id] = node
+            fallback.add(0)
+
+    graph_docs = [
+        GraphDocument(nodes=list(nodes.values()), relationships=rels, source=doc)
+        for doc, nodes, rels in zip(documents, chunk_nodes, chunk_rels)
+    ]
+    return graph_docs, fallback
+
+
+def extract_graph_documents(
+    documents: List[Document], transformer: LLMGraphTransformer
+) -> Tuple[List[GraphDocument], List[GraphDocument]]:
+    """Extract a graph for a batch of chunks with a single LLM call.
+
+    Returns all graph documents and the subset that is safe to cache per chunk.
+    """
+    if len(documents) == 1:
+        graph_docs = transformer.convert_to_graph_documents(documents)
+        return graph_docs, graph_docs
+    combined = Document(page_content="\n\n".join(doc.page_content for doc in documents))
+    graph_docs = transformer.convert_to_graph_documents([combined])
+    if not graph_docs:
+        return [], []
+    split, fallback = split_graph_document(graph_docs[0], documents)
+    return split, [graph_doc for i, graph_doc in enumerate(split) if i not in fallback]
+
+
+def document_id(document: Document) -> str:
+    """Id of the Document node written for a chunk: the chunk's content hash."""
+    if not document.metadata.get("id"):
+        document.metadata["id"] = content_hash(document.page_content)
+    return document.metadata["id"]
+
+
+def existing_document_ids(ids: List[str]) -> Set[str]:
+    """Return the subset of `ids` that already have an embedded Document node.
+
+    Documents whose embedding failed are left out, so re-ingesting the file
+    (with extractions served from the cache) gives them a vector.
+    """
+    rows = resources.graph.query(
+        "UNWIND $ids AS id MATCH (d:Document {id: id}) WHERE d.embedding IS NOT NULL RETURN d.id AS id",
+        {"ids": ids},
+    )
+    return {row["id"] for row in rows}
+
+
+def extraction_cache_key(document: Document) -> str:
+    return cache_key(document_id(document), EXTRACTION_MODEL, EXTRACTION_PROMPT_VERSION)
+
+
+class ExtractionBatch:
+    """Chunks of one batch that are not in the graph yet, with any cached extractions."""
+
+    def __init__(self, documents: List[Document], cached: Dict[str, GraphDocument]):
+        self.documents = documents
+        self.cached = cached
+
+    @property
+    def misses(self) -> List[Document]:
+        return [doc for doc in self.documents if document_id(doc) not in self.cached]
+
+    def split(self) -> Tuple["ExtractionBatch", "ExtractionBatch"]:
+        middle = len(self.documents) // 2
+        return (
+            ExtractionBatch(self.documents[:middle], self.cached),
+            ExtractionBatch(self.documents[middle:], self.cached),
         )
-        Neo4jVector.from_existing_graph(
-            embeddModel,
-            search_type="hybrid",
-            node_label="Document",
-            text_node_properties=["text"],
-            embedding_node_property="embedding",
+
+    def __len__(self):
+        return len(self.documents)
+
+
+def prepare_batches(
+    batches: Iterable[List[Document]],
+    cache: ExtractionCache,
+    progress=None,
+) -> Iterator[ExtractionBatch]:
+    """Drop chunks already in Neo4j and attach cached extractions to the rest."""
+    seen = set()
+    for batch in batches:
+        existing = existing_document_ids([document_id(doc) for doc in batch])
+        new_docs = []
+        for doc in batch:
+            doc_id = document_id(doc)
+            if doc_id in existing or doc_id in seen:
+                continue
+            seen.add(doc_id)
+            new_docs.append(doc)
+        if len(new_docs) < len(batch):
+            print(f"Skipping {len(batch) - len(new_docs)} chunks already in the graph.")
+            if progress:
+                progress.advance(len(batch) - len(new_docs))
+        if not new_docs:
+            continue
+
+        keys = {document_id(doc): extraction_cache_key(doc) for doc in new_docs}
+        payloads = cache.get_many(list(keys.values()))
+        cached = {
+            document_id(doc): graph_document_from_json(payloads[keys[document_id(doc)]], doc)
+            for doc in new_docs
+            if keys[document_id(doc)] in payloads
+        }
+        yield ExtractionBatch(new_docs, cached)
+
+
+def add_documents_to_graph(
+    batch: ExtractionBatch,
+    transformer: LLMGraphTransformer,
+    embedding_stage: EmbeddingStage,
+    cache: ExtractionCache,
+    writer: GraphWriter,
+):
+    """Add a batch of processed documents to the Neo4j graph in one write."""
+    batch_graph_docs = [batch.cached[document_id(doc)] for doc in batch.documents if document_id(doc) in batch.cached]
+    misses = batch.misses
+    if misses:
+        extracted, cacheable = extract_graph_documents(misses, transformer)
+        for graph_doc in cacheable:
+            cache.put(extraction_cache_key(graph_doc.source), graph_document_to_json(graph_doc))
+        batch_graph_docs.extend(extracted)
+    writer.write(batch_graph_docs)
+    graph_generation.bump()
+    # Keep the chat-side gazetteer in sync with the new entities
+    entity_matcher.add(node.id for doc in batch_graph_docs for node in doc.nodes)
+    # Embeddings are computed in large batches by the embedding stage, not per write
+    embedding_stage.add([(document_id(doc.source), doc.source.page_content) for doc in batch_graph_docs])
+    print(f"Processed batch with {len(batch_graph_docs)} documents ({len(misses)} extracted, {len(batch) - len(misses)} cached).")
+
+
+# Rough prompt + completion size of one LLMGraphTransformer call, used for TPM budgeting
+EXTRACTION_PROMPT_TOKENS = int(os.getenv("EXTRACTION_PROMPT_TOKENS", "1200"))
+EXTRACTION_OUTPUT_TOKENS = int(os.getenv("EXTRACTION_OUTPUT_TOKENS", "400"))
+
+
+def estimate_extraction_tokens(batch: ExtractionBatch) -> int:
+    """Estimate the Groq tokens one extraction call over the batch will consume (0 if fully cached)."""
+    misses = batch.misses
+    if not misses:
+        return 0
+    text_tokens = sum(count_tokens(doc.page_content) for doc in misses)
+    return EXTRACTION_PROMPT_TOKENS + EXTRACTION_OUTPUT_TOKENS * len(misses) + text_tokens
+
+
+def process_batches(documents: Iterable[Document], progress=None):
+    """Process documents in multi-chunk batches concurrently across all configured API keys.
+
+    `progress`, if given, is told about finished chunks (`advance(n)`) and
+    chunks that could not be ingested (`add_error(message)`).
+    """
+    transformers = {api_key: LLMGraphTransformer(llm=get_llm(api_key)) for api_key in GROQ_API_KEYS}
+    batcher = AdaptiveBatcher(count_tokens=count_tokens)
+    scheduler = ExtractionScheduler(GROQ_API_KEYS)
+    embedding_stage = EmbeddingStage(resources.graph, resources.embeddings)
+    cache = get_extraction_cache()
+    writer = GraphWriter(resources.driver)
+
+    def handle(api_key: str, batch: ExtractionBatch):
+        print(f"Processing batch of {len(batch)} chunks...")
+        try:
+            add_documents_to_graph(batch, transformers[api_key], embedding_stage, cache, writer)
+            batcher.grow()
+            if progress:
+                progress.advance(len(batch))
+        except Exception as e:
+            # Let the scheduler see 429s so it can back off the offending key
+            if is_rate_limit_error(e):
+                raise
+            if len(batch) == 1:
+                print(f"Error processing documents: {e}")
+                report_error(batch, e)
+                return
+            # Too much for the model in one go: shrink and retry both halves
+            batcher.shrink()
+            print(f"Batch of {len(batch)} failed ({e}); retrying as two halves.")
+            scheduler.push(*batch.split())
+
+    def report_error(batch: ExtractionBatch, error: Exception):
+        if progress:
+            progress.advance(len(batch))
+            progress.add_error(f"{len(batch)} chunk(s) failed: {error}")
+
+    try:
+        scheduler.run(
+            prepare_batches(batcher.batches(documents), cache, progress),
+            handle,
+            estimate_tokens=estimate_extraction_tokens,
+            on_error=report_error,
         )
-        print(f"Processed batch with {len(batch_graph_docs)} documents.")
-    except Exception as e:
-        print(f"Error processing documents: {e}")
-
-
-def process_batches(documents: List[Document]):
-    """Process document batches using multiple API keys."""
-    num_keys = len(GROQ_API_KEYS)
-    for i, document_batch in enumerate(documents):
-        print(f"Processing batch {i + 1}/{len(documents)}...")
-        api_key_index = i % num_keys  # Round-robin API key selection
-        transformer = LLMGraphTransformer(llm=get_llm(GROQ_API_KEYS[api_key_index]))
-        add_documents_to_graph([document_batch], transformer)
-        time.sleep(5)  # Wait for 10 seconds before using the next API key
+    finally:
+        # Documents already written still need vectors, even if the source failed midway
+        unembedded = embedding_stage.flush()
+        if unembedded and progress:
+            progress.add_error(f"{len(unembedded)} chunk(s) were written without embeddings; re-upload to retry.")
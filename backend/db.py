@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pool sizing and connection recycling
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "2"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+PG_POOL_ACQUIRE_TIMEOUT = float(os.getenv("PG_POOL_ACQUIRE_TIMEOUT", "10"))
+PG_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("PG_POOL_MAX_INACTIVE_LIFETIME", "300"))
+PG_HEALTHCHECK_INTERVAL = float(os.getenv("PG_HEALTHCHECK_INTERVAL", "30"))
+
+
+class PoolState:
+    """The shared pool plus the counters behind its saturation metrics."""
+
+    def __init__(self):
+        self.pool: Optional[asyncpg.Pool] = None
+        self.waiting = 0
+        self.acquired_total = 0
+        self.wait_seconds_total = 0.0
+        self.healthy: Optional[bool] = None
+        self.last_health_check: Optional[float] = None
+        self.health_task: Optional[asyncio.Task] = None
+
+
+_state = PoolState()
+
+
+async def init_pool():
+    """Create the process-wide PostgreSQL pool (called at startup)."""
+    _state.pool = await asyncpg.create_pool(
+        host=os.getenv("PG_HOST"),
+        port=int(os.getenv("PG_PORT", "5432")),
+        database=os.getenv("PG_DBNAME"),
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        min_size=PG_POOL_MIN_SIZE,
+        max_size=PG_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=PG_POOL_MAX_INACTIVE_LIFETIME,
+    )
+    _state.health_task = asyncio.create_task(_health_loop())
+    print(f"Database '{os.getenv('PG_DBNAME')}' pool ready (max {PG_POOL_MAX_SIZE} connections).")
+
+
+async def close_pool():
+    """Close every pooled connection (called at shutdown)."""
+    if _state.health_task:
+        _state.health_task.cancel()
+    if _state.pool is not None:
+        await _state.pool.close()
+        _state.pool = None
+
+
+@asynccontextmanager
+async def acquire():
+    """Borrow a pooled connection; every PostgreSQL query goes through here."""
+    if _state.pool is None:
+        raise RuntimeError("Database pool is not initialized.")
+    _state.waiting += 1
+    start = time.monotonic()
+    try:
+        conn = await _state.pool.acquire(timeout=PG_POOL_ACQUIRE_TIMEOUT)
+    finally:
+        _state.waiting -= 1
+        _state.wait_seconds_total += time.monotonic() - start
+    _state.acquired_total += 1
+    try:
+        yield conn
+    finally:
+        await _state.pool.release(conn)
+
+
+async def check_health() -> bool:
+    """Run a trivial query through the pool and remember the outcome."""
+    try:
+        async with acquire() as conn:
+            await conn.fetchval("SELECT 1")
+        _state.healthy = True
+    except Exception as e:
+        print(f"Database health check failed: {e}")
+        _state.healthy = False
+    _state.last_health_check = time.time()
+    return _state.healthy
+
+
+async def _health_loop():
+    while True:
+        await asyncio.sleep(PG_HEALTHCHECK_INTERVAL)
+        await check_health()
+
+
+def pool_metrics() -> dict:
+    """Pool size, usage and wait statistics."""
+    pool = _state.pool
+    size = pool.get_size() if pool else 0
+    idle = pool.get_idle_size() if pool else 0
+    in_use = size - idle
+    return {
+        "size": size,
+        "idle": idle,
+        "in_use": in_use,
+        "min_size": PG_POOL_MIN_SIZE,
+        "max_size": PG_POOL_MAX_SIZE,
+        "saturation": in_use / PG_POOL_MAX_SIZE if PG_POOL_MAX_SIZE else None,
+        "waiting": _state.waiting,
+        "acquired_total": _state.acquired_total,
+        "avg_wait_ms": (
+            1000 * _state.wait_seconds_total / _state.acquired_total if _state.acquired_total else 0.0
+        ),
+        "healthy": _state.healthy,
+        "last_health_check": _state.last_health_check,
+    }
@@ -0,0 +1,304 @@
+import os
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional, Tuple
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from langchain_core.embeddings import Embeddings
+
+# "torch" (fp32), "int8" (dynamically quantized Linear layers) or "onnx" (ONNX Runtime)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# CPU threads for inference; 0 keeps the library default
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# Texts per forward pass (also the slice size for ingestion batches, so queries
+# never wait behind more than one slice), and how long a query waits for company
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+# Fraction of batches re-embedded with the fp32 model to measure drift (0 disables)
+EMBEDDING_ACCURACY_SAMPLE_RATE = float(os.getenv("EMBEDDING_ACCURACY_SAMPLE_RATE", "0"))
+# Cosine similarity to fp32 below which a sampled batch is reported
+EMBEDDING_ACCURACY_THRESHOLD = float(os.getenv("EMBEDDING_ACCURACY_THRESHOLD", "0.99"))
+
+
+class _Request:
+    """One caller's texts; documents may be encoded over several passes."""
+
+    def __init__(self, texts: List[str], on_done: Optional[Callable[[], None]] = None):
+        self.texts = texts
+        self.offset = 0
+        self.parts: List[np.ndarray] = []
+        self.done = threading.Event()
+        self.on_done = on_done
+        self.vectors: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+    def finish(self):
+        self.done.set()
+        if self.on_done is not None:
+            self.on_done()
+
+
+def load_model(path: str, backend: str = EMBEDDING_BACKEND, threads: int = EMBEDDING_THREADS) -> SentenceTransformer:
+    """Load the sentence-transformers model for the given CPU backend."""
+    if threads > 0:
+        torch.set_num_threads(threads)
+    if backend == "torch":
+        return SentenceTransformer(path, device="cpu")
+    if backend == "int8":
+        model = SentenceTransformer(path, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=onnx needs `pip install optimum[onnxruntime]`.") from e
+        session_options = onnxruntime.SessionOptions()
+        if threads > 0:
+            session_options.intra_op_num_threads = threads
+        return SentenceTransformer(
+            path,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={"provider": "CPUExecutionProvider", "session_options": session_options},
+        )
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+class EmbeddingEngine(Embeddings):
+    """CPU embedding model that serves concurrent callers in micro-batches.
+
+    A single worker thread owns the model. Query embeddings (`embed_query`)
+    are gathered for up to `max_wait_ms`, or until `max_batch` are waiting,
+    and encoded in one forward pass. Document embeddings (`embed_documents`,
+    used by ingestion) are encoded `max_batch` texts at a time, and waiting
+    queries always go first, so a question never sits behind a whole upload.
+    With a quantized or ONNX backend, a sample of batches can be re-embedded
+    with the fp32 model on a separate thread to check the vectors still
+    agree. Inputs are preprocessed like `HuggingFaceEmbeddings`, so fp32
+    vectors match the ones already stored in the graph.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        backend: str = EMBEDDING_BACKEND,
+        threads: int = EMBEDDING_THREADS,
+        max_batch: int = EMBEDDING_MAX_BATCH,
+        max_wait_ms: float = EMBEDDING_MAX_WAIT_MS,
+        accuracy_sample_rate: float = EMBEDDING_ACCURACY_SAMPLE_RATE,
+    ):
+        self.path = path
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.accuracy_sample_rate = accuracy_sample_rate if backend != "torch" else 0.0
+        self.model = load_model(path, backend, threads)
+        self.reference: Optional[SentenceTransformer] = None
+        self.accuracy_executor: Optional[ThreadPoolExecutor] = None
+        self.accuracy_running = False
+        if self.accuracy_sample_rate:
+            # Loaded now, not on first sample, so no caller ever waits for it
+            self.reference = load_model(path, "torch", 0)
+            self.accuracy_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-accuracy")
+        self.queries: Deque[_Request] = deque()
+        self.documents: Deque[_Request] = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+        self.encode_seconds = 0.0
+        self.accuracy_checks = 0
+        self.min_similarity: Optional[float] = None
+        self.similarity_total = 0.0
+        self.similarity_count = 0
+        self.worker = threading.Thread(target=self._run, name="embedding-engine", daemon=True)
+        self.worker.start()
+
+    def _encode(self, model: SentenceTransformer, texts: List[str]) -> np.ndarray:
+        return model.encode(texts, batch_size=self.max_batch, convert_to_numpy=True)
+
+    def _enqueue(self, request: _Request, queue: Deque[_Request]):
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("Embedding engine is closed.")
+            queue.append(request)
+            self.cond.notify()
+
+    def _submit(self, texts: List[str], queue: Deque[_Request]) -> np.ndarray:
+        request = _Request([text.replace("\n", " ") for text in texts])
+        self._enqueue(request, queue)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    async def _asubmit(self, texts: List[str], queue: Deque[_Request]) -> np.ndarray:
+        # Woken by the worker, so waiting callers hold no thread
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _resolve():
+            if not future.done():
+                future.set_result(None)
+
+        request = _Request(
+            [text.replace("\n", " ") for text in texts],
+            on_done=lambda: loop.call_soon_threadsafe(_resolve),
+        )
+        self._enqueue(request, queue)
+        await future
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._submit(texts, self.documents).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text], self.queries)[0].tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return (await self._asubmit(texts, self.documents)).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._asubmit([text], self.queries))[0].tolist()
+
+    def _next_batch(self) -> Optional[List[Tuple[_Request, int, int]]]:
+        """Pick the next forward pass as (request, start, end) slices; None once closed and drained."""
+        with self.cond:
+            while not self.queries and not self.documents:
+                if self.closed:
+                    return None
+                self.cond.wait()
+            if self.queries:
+                # Give concurrent questions a moment to share this pass
+                deadline = time.monotonic() + self.max_wait
+                while len(self.queries) < self.max_batch and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                slices, count = [], 0
+                while self.queries and count < self.max_batch:
+                    request = self.queries.popleft()
+                    slices.append((request, 0, len(request.texts)))
+                    count += len(request.texts)
+                return slices
+            # One slice of the oldest document request; queries are checked again before the next
+            request = self.documents[0]
+            start = request.offset
+            end = min(start + self.max_batch, len(request.texts))
+            request.offset = end
+            if end == len(request.texts):
+                self.documents.popleft()
+            return [(request, start, end)]
+
+    def _run(self):
+        while True:
+            slices = self._next_batch()
+            if slices is None:
+                return
+            self._process(slices)
+
+    def _process(self, slices: List[Tuple[_Request, int, int]]):
+        texts = [text for request, start, end in slices for text in request.texts[start:end]]
+        try:
+            started = time.monotonic()
+            vectors = self._encode(self.model, texts)
+            elapsed = time.monotonic() - started
+        except Exception as e:
+            for request, _, _ in slices:
+                self._fail(request, e)
+            return
+        offset = 0
+        for request, start, end in slices:
+            request.parts.append(vectors[offset:offset + end - start])
+            offset += end - start
+            if end == len(request.texts):
+                request.vectors = np.vstack(request.parts)
+                request.finish()
+        with self.lock:
+            self.batches += 1
+            self.texts += len(texts)
+            self.encode_seconds += elapsed
+        if self.accuracy_sample_rate and not self.accuracy_running and random.random() < self.accuracy_sample_rate:
+            # At most one check in flight; it runs beside the worker, not on it
+            self.accuracy_running = True
+            self.accuracy_executor.submit(self._sample_accuracy, texts, vectors)
+
+    def _fail(self, request: _Request, error: BaseException):
+        with self.cond:
+            if request in self.documents:
+                self.documents.remove(request)
+        request.error = error
+        request.finish()
+
+    def _sample_accuracy(self, texts: List[str], vectors: np.ndarray):
+        try:
+            self.check_accuracy(texts, vectors)
+        except Exception as e:
+            print(f"Error checking embedding accuracy: {e}")
+        finally:
+            self.accuracy_running = False
+
+    def check_accuracy(self, texts: List[str], vectors: Optional[np.ndarray] = None) -> dict:
+        """Compare this backend's embeddings of `texts` with the fp32 model's."""
+        if self.reference is None:
+            self.reference = load_model(self.path, "torch", 0)
+        if vectors is None:
+            vectors = self._encode(self.model, texts)
+        similarities = _cosine(vectors, self._encode(self.reference, texts))
+        worst = float(similarities.min())
+        with self.lock:
+            self.accuracy_checks += 1
+            self.similarity_total += float(similarities.sum())
+            self.similarity_count += len(similarities)
+            self.min_similarity = worst if self.min_similarity is None else min(self.min_similarity, worst)
+        if worst < EMBEDDING_ACCURACY_THRESHOLD:
+            print(
+                f"{self.backend} embeddings drifted from fp32: min cosine {worst:.4f} "
+                f"< {EMBEDDING_ACCURACY_THRESHOLD} over {len(texts)} texts"
+            )
+        return {"min_similarity": worst, "mean_similarity": float(similarities.mean())}
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "backend": self.backend,
+                "batches": self.batches,
+                "texts": self.texts,
+                "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "avg_encode_ms": 1000 * self.encode_seconds / self.batches if self.batches else 0.0,
+                "queued_queries": len(self.queries),
+                "queued_documents": len(self.documents),
+                "accuracy_checks": self.accuracy_checks,
+                "min_similarity": self.min_similarity,
+                "mean_similarity": (
+                    self.similarity_total / self.similarity_count if self.similarity_count else None
+                ),
+            }
+
+    def close(self):
+        """Finish queued requests and stop the worker."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.worker.join()
+        if self.accuracy_executor is not None:
+            self.accuracy_executor.shutdown(wait=False)
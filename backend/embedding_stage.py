@@ -0,0 +1,73 @@
+import os
+import threading
+from typing import List, Tuple
+from caching import graph_generation
+
+# Number of Document nodes embedded per model call and per UNWIND write
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+WRITE_EMBEDDINGS_QUERY = """
+UNWIND $rows AS row
+MATCH (d:Document {id: row.id})
+CALL db.create.setNodeVectorProperty(d, 'embedding', row.embedding)
+"""
+
+
+class EmbeddingStage:
+    """Embed newly written Document nodes in large batches.
+
+    Ingestion workers call `add` with the id and text of every Document they
+    write. Once `batch_size` are pending, they are embedded with one model
+    call and written back with a single UNWIND query. `flush` drains the rest.
+    Embedding failures never reach the caller (they are not extraction
+    failures); failed batches are kept and retried once by `flush`.
+    """
+
+    def __init__(self, graph, embeddings, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.graph = graph
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.pending: List[Tuple[str, str]] = []
+        self.lock = threading.Lock()
+        self.embedded = 0
+        self.failed: List[Tuple[str, str]] = []
+
+    def add(self, documents: List[Tuple[str, str]]):
+        """Queue `(document_id, text)` pairs and embed a batch when one is full."""
+        with self.lock:
+            self.pending.extend(documents)
+            if len(self.pending) < self.batch_size:
+                return
+            batch, self.pending = self.pending, []
+        self._embed(batch)
+
+    def flush(self) -> List[str]:
+        """Embed everything pending, retry earlier failures, and return ids still without vectors."""
+        with self.lock:
+            batch, self.pending = self.failed + self.pending, []
+            self.failed = []
+        for start in range(0, len(batch), self.batch_size):
+            self._embed(batch[start:start + self.batch_size])
+        with self.lock:
+            failed, self.failed = self.failed, []
+        return [doc_id for doc_id, _ in failed]
+
+    def _embed(self, batch: List[Tuple[str, str]]):
+        if not batch:
+            return
+        try:
+            self._write(batch)
+        except Exception as e:
+            print(f"Error embedding {len(batch)} documents: {e}")
+            with self.lock:
+                self.failed.extend(batch)
+
+    def _write(self, batch: List[Tuple[str, str]]):
+        vectors = self.embeddings.embed_documents([text for _, text in batch])
+        rows = [{"id": doc_id, "embedding": vector} for (doc_id, _), vector in zip(batch, vectors)]
+        self.graph.query(WRITE_EMBEDDINGS_QUERY, {"rows": rows})
+        # New vectors change similarity search results
+        graph_generation.bump()
+        with self.lock:
+            self.embedded += len(rows)
+        print(f"Embedded {len(rows)} documents.")
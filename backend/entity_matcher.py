@@ -0,0 +1,164 @@
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Set
+
+# Use the local matcher before falling back to the LLM entity chain
+ENTITY_MATCHER_ENABLED = os.getenv("ENTITY_MATCHER_ENABLED", "true").lower() == "true"
+# Tokens at least this long also match with one typo (insert, delete or substitute)
+ENTITY_FUZZY_MIN_LENGTH = int(os.getenv("ENTITY_FUZZY_MIN_LENGTH", "5"))
+# Most entity names returned per question
+ENTITY_MATCH_MAX_RESULTS = int(os.getenv("ENTITY_MATCH_MAX_RESULTS", "10"))
+# Entity ids inserted per lock hold, so matching never waits long behind ingestion
+ENTITY_ADD_SLICE = int(os.getenv("ENTITY_ADD_SLICE", "200"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Single-token entities that are too generic to be worth matching on their own
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "if", "in", "is", "it", "me", "my", "no", "not", "of", "on", "or", "our", "so", "the",
+    "this", "to", "we", "what", "when", "where", "which", "who", "why", "with", "you", "your",
+}
+
+
+def normalize_token(token: str) -> str:
+    """Fold simple plurals so "accounts" and "account" match."""
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [normalize_token(token) for token in TOKEN_RE.findall(text.lower())]
+
+
+def _deletes(token: str) -> Set[str]:
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class EntityIndex:
+    """Token trie and typo index over a set of entity ids (not thread-safe)."""
+
+    def __init__(self):
+        self.trie: Dict = {}
+        self.vocabulary: Set[str] = set()
+        self.deletes: Dict[str, Set[str]] = {}
+        self.size = 0
+
+    def add(self, entity_id: str):
+        tokens = tokenize(str(entity_id))
+        if not tokens or (len(tokens) == 1 and (tokens[0] in STOPWORDS or len(tokens[0]) < 3)):
+            return
+        node = self.trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+            self._add_token(token)
+        if "$" not in node:
+            self.size += 1
+        node.setdefault("$", set()).add(str(entity_id))
+
+    def _add_token(self, token: str):
+        if token in self.vocabulary:
+            return
+        self.vocabulary.add(token)
+        if len(token) >= ENTITY_FUZZY_MIN_LENGTH:
+            for variant in _deletes(token) | {token}:
+                self.deletes.setdefault(variant, set()).add(token)
+
+    def _candidates(self, token: str) -> Set[str]:
+        """Vocabulary tokens within one edit of `token`."""
+        if token in self.vocabulary:
+            return {token}
+        if len(token) < ENTITY_FUZZY_MIN_LENGTH - 1:
+            return set()
+        matches = set(self.deletes.get(token, ()))
+        for variant in _deletes(token):
+            if variant in self.vocabulary:
+                matches.add(variant)
+            matches |= self.deletes.get(variant, set())
+        return matches
+
+    def match(self, tokens: List[str], max_results: int) -> List[str]:
+        found: List[str] = []
+        i = 0
+        while i < len(tokens) and len(found) < max_results:
+            best_end, best_ids = 0, None
+            frontier = [self.trie]
+            for j in range(i, len(tokens)):
+                candidates = self._candidates(tokens[j])
+                frontier = [node[c] for node in frontier for c in candidates if c in node]
+                if not frontier:
+                    break
+                ids = set().union(*(node.get("$", set()) for node in frontier))
+                if ids:
+                    best_end, best_ids = j + 1, ids
+            if best_ids:
+                found.extend(sorted(best_ids - set(found)))
+                i = best_end
+            else:
+                i += 1
+        return found[:max_results]
+
+
+class EntityMatcher:
+    """Gazetteer of graph entity ids matched against questions without an LLM.
+
+    Entity ids are indexed as normalized token sequences in a trie, and each
+    question is scanned for the longest entity match at every token. Long
+    tokens are also indexed by their single-character deletions (SymSpell
+    style), so one typo per token still matches. Entities can be added at
+    any time, which keeps the matcher in sync with ingestion.
+
+    `match` only ever waits for a short critical section: `load` builds a
+    new index without the read lock and swaps it in, and `add` inserts in
+    small slices. Writers are serialized by a separate lock.
+    """
+
+    def __init__(self):
+        self.index = EntityIndex()
+        self.loaded = False
+        # Guards the live index against concurrent reads; held briefly
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self.index.size
+
+    def load(self, graph):
+        """Index every `__Entity__` id currently in the graph."""
+        # Writers wait from the query to the swap, so no concurrent `add` is lost
+        with self.write_lock:
+            rows = graph.query("MATCH (e:__Entity__) WHERE e.id IS NOT NULL RETURN e.id AS id")
+            index = EntityIndex()
+            for row in rows:
+                index.add(row["id"])
+            with self.lock:
+                self.index = index
+        self.loaded = True
+        print(f"Entity matcher loaded {self.size} entities.")
+
+    def clear(self):
+        """Forget every entity, e.g. after the graph has been wiped."""
+        with self.write_lock:
+            with self.lock:
+                self.index = EntityIndex()
+
+    def add(self, entity_ids: Iterable[str]):
+        entity_ids = list(entity_ids)
+        with self.write_lock:
+            for start in range(0, len(entity_ids), ENTITY_ADD_SLICE):
+                with self.lock:
+                    for entity_id in entity_ids[start:start + ENTITY_ADD_SLICE]:
+                        self.index.add(entity_id)
+
+    def match(self, text: str, max_results: int = ENTITY_MATCH_MAX_RESULTS) -> List[str]:
+        """Return the entity ids mentioned in `text`, longest matches first."""
+        tokens = tokenize(text)
+        with self.lock:
+            return self.index.match(tokens, max_results)
+
+
+# Process-wide gazetteer, loaded at startup and extended by ingestion
+entity_matcher = EntityMatcher()
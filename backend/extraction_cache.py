@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+from langchain.schema import Document
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "extraction_cache.sqlite3")
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def content_hash(text: str) -> str:
+    """Content address of a chunk; also used as its Document node id."""
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def cache_key(chunk_hash: str, model_name: str, prompt_version: str) -> str:
+    """Extraction results depend on the chunk, the model and the prompt."""
+    return hashlib.sha256(f"{model_name}\0{prompt_version}\0{chunk_hash}".encode("utf-8")).hexdigest()
+
+
+# Serialize a GraphDocument without its source; the chunk is re-attached on load
+def _node_to_dict(node: Node) -> dict:
+    return {"id": node.id, "type": node.type, "properties": node.properties}
+
+
+def graph_document_to_json(graph_doc: GraphDocument) -> str:
+    return json.dumps(
+        {
+            "nodes": [_node_to_dict(node) for node in graph_doc.nodes],
+            "relationships": [
+                {
+                    "source": _node_to_dict(rel.source),
+                    "target": _node_to_dict(rel.target),
+                    "type": rel.type,
+                    "properties": rel.properties,
+                }
+                for rel in graph_doc.relationships
+            ],
+        }
+    )
+
+
+def graph_document_from_json(payload: str, source: Document) -> GraphDocument:
+    data = json.loads(payload)
+    return GraphDocument(
+        nodes=[Node(**node) for node in data["nodes"]],
+        relationships=[
+            Relationship(
+                source=Node(**rel["source"]),
+                target=Node(**rel["target"]),
+                type=rel["type"],
+                properties=rel["properties"],
+            )
+            for rel in data["relationships"]
+        ],
+        source=source,
+    )
+
+
+class ExtractionCache:
+    """Persistent SQLite cache of extracted graphs with LRU eviction by size."""
+
+    def __init__(self, path: str = EXTRACTION_CACHE_PATH, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS extractions_last_access ON extractions (last_access)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        if not keys:
+            return {}
+        placeholders = ",".join("?" for _ in keys)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT key, payload FROM extractions WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            if rows:
+                self.conn.executemany(
+                    "UPDATE extractions SET last_access = ? WHERE key = ?",
+                    [(time.time(), key) for key, _ in rows],
+                )
+                self.conn.commit()
+        return dict(rows)
+
+    def put(self, key: str, payload: str):
+        size = len(payload.encode("utf-8"))
+        with self.lock:
+            previous = self.conn.execute("SELECT size FROM extractions WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, payload, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, size, time.time()),
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits its size budget."""
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM extractions ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for key, size in rows:
+                self.conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    return
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Process-wide cache instance, opened on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractionCache()
+    return _cache
@@ -0,0 +1,109 @@
+import os
+from collections import defaultdict
+from typing import Dict, List
+from langchain_community.graphs.graph_document import GraphDocument
+
+# Rows sent per UNWIND statement; all statements of one write share a transaction
+GRAPH_WRITE_BATCH_SIZE = int(os.getenv("GRAPH_WRITE_BATCH_SIZE", "1000"))
+
+# Schema the ingestion and retrieval queries rely on
+SCHEMA_QUERIES = [
+    "CREATE CONSTRAINT entity_id IF NOT EXISTS FOR (n:__Entity__) REQUIRE n.id IS UNIQUE",
+    "CREATE CONSTRAINT document_id IF NOT EXISTS FOR (d:Document) REQUIRE d.id IS UNIQUE",
+    "CREATE FULLTEXT INDEX entity IF NOT EXISTS FOR (n:__Entity__) ON EACH [n.id]",
+]
+
+DOCUMENTS_QUERY = """
+UNWIND $rows AS row
+MERGE (d:Document {id: row.id})
+SET d.text = row.text
+SET d += row.metadata
+"""
+
+# Labels and relationship types cannot be parameters, so one statement per group
+NODES_QUERY = """
+UNWIND $rows AS row
+MERGE (n:__Entity__ {{id: row.id}})
+SET n:{label}
+SET n += row.properties
+WITH n, row
+MATCH (d:Document {{id: row.document_id}})
+MERGE (d)-[:MENTIONS]->(n)
+"""
+
+RELATIONSHIPS_QUERY = """
+UNWIND $rows AS row
+MERGE (s:__Entity__ {{id: row.source}})
+MERGE (t:__Entity__ {{id: row.target}})
+MERGE (s)-[r:{type}]->(t)
+SET r += row.properties
+"""
+
+
+def quote_identifier(name: str) -> str:
+    """Backtick-quote a label or relationship type for safe inlining in Cypher."""
+    return "`" + str(name).replace("`", "``") + "`"
+
+
+def ensure_graph_schema(driver):
+    """Create the uniqueness constraints and full-text index if they are missing."""
+    with driver.session() as session:
+        for query in SCHEMA_QUERIES:
+            try:
+                session.run(query).consume()
+            except Exception as e:
+                print(f"Error creating graph schema ({query}): {e}")
+    print("Graph constraints and indexes are in place.")
+
+
+def _chunks(rows: List[dict], size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class GraphWriter:
+    """Write graph documents with grouped, parameterized UNWIND ... MERGE statements.
+
+    Equivalent to `Neo4jGraph.add_graph_documents(baseEntityLabel=True,
+    include_source=True)`, but nodes are grouped by label and relationships
+    by type so each group is one statement, and a whole batch is written in
+    a single transaction.
+    """
+
+    def __init__(self, driver, batch_size: int = GRAPH_WRITE_BATCH_SIZE):
+        self.driver = driver
+        self.batch_size = batch_size
+
+    def write(self, graph_documents: List[GraphDocument]):
+        documents = []
+        nodes: Dict[str, List[dict]] = defaultdict(list)
+        relationships: Dict[str, List[dict]] = defaultdict(list)
+        for graph_doc in graph_documents:
+            source = graph_doc.source
+            document_id = source.metadata["id"]
+            documents.append({"id": document_id, "text": source.page_content, "metadata": source.metadata})
+            for node in graph_doc.nodes:
+                nodes[node.type].append(
+                    {"id": node.id, "properties": node.properties, "document_id": document_id}
+                )
+            for rel in graph_doc.relationships:
+                relationships[rel.type].append(
+                    {"source": rel.source.id, "target": rel.target.id, "properties": rel.properties}
+                )
+
+        statements = [(DOCUMENTS_QUERY, documents)]
+        statements += [
+            (NODES_QUERY.format(label=quote_identifier(label)), rows) for label, rows in nodes.items()
+        ]
+        statements += [
+            (RELATIONSHIPS_QUERY.format(type=quote_identifier(rel_type)), rows)
+            for rel_type, rows in relationships.items()
+        ]
+
+        def work(tx):
+            for query, rows in statements:
+                for chunk in _chunks(rows, self.batch_size):
+                    tx.run(query, rows=chunk).consume()
+
+        with self.driver.session() as session:
+            session.execute_write(work)
@@ -0,0 +1,120 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# Concurrent ingestion jobs; kept small so uploads never starve /chat
+INGESTION_MAX_JOBS = int(os.getenv("INGESTION_MAX_JOBS", "2"))
+# Finished jobs kept around for status queries
+INGESTION_JOB_HISTORY = int(os.getenv("INGESTION_JOB_HISTORY", "100"))
+# Errors kept per job (the count is always exact)
+INGESTION_MAX_REPORTED_ERRORS = 20
+
+
+class Job:
+    """Progress of one background ingestion job."""
+
+    def __init__(self, filename: str):
+        self.id = str(uuid.uuid4())
+        self.filename = filename
+        self.status = "queued"
+        self.chunks_total: Optional[int] = None
+        self.chunks_seen = 0
+        self.chunks_done = 0
+        self.error_count = 0
+        self.errors: List[str] = []
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def track(self, documents: Iterable) -> Iterator:
+        """Count chunks as the parser produces them; the total is known once it finishes."""
+        for document in documents:
+            with self.lock:
+                self.chunks_seen += 1
+            yield document
+        with self.lock:
+            self.chunks_total = self.chunks_seen
+
+    def advance(self, chunks: int):
+        with self.lock:
+            self.chunks_done += chunks
+
+    def add_error(self, message: str):
+        with self.lock:
+            self.error_count += 1
+            if len(self.errors) < INGESTION_MAX_REPORTED_ERRORS:
+                self.errors.append(message)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            elapsed = None
+            throughput = None
+            eta = None
+            if self.started_at:
+                elapsed = (self.finished_at or time.time()) - self.started_at
+                if elapsed > 0 and self.chunks_done:
+                    throughput = self.chunks_done / elapsed
+            if throughput and self.chunks_total is not None and self.status == "running":
+                eta = max(self.chunks_total - self.chunks_done, 0) / throughput
+            return {
+                "job_id": self.id,
+                "filename": self.filename,
+                "status": self.status,
+                "chunks_done": self.chunks_done,
+                "chunks_total": self.chunks_total,
+                "chunks_discovered": self.chunks_seen,
+                "throughput_chunks_per_second": throughput,
+                "elapsed_seconds": elapsed,
+                "eta_seconds": eta,
+                "error_count": self.error_count,
+                "errors": list(self.errors),
+            }
+
+
+class JobManager:
+    """Run ingestion jobs on a bounded worker pool and keep their status."""
+
+    def __init__(self, max_workers: int = INGESTION_MAX_JOBS, history: int = INGESTION_JOB_HISTORY):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self.history = history
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, filename: str, target: Callable[[Job], None]) -> Job:
+        job = Job(filename)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self.executor.submit(self._run, job, target)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job: Job, target: Callable[[Job], None]):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            target(job)
+            job.status = "completed"
+        except Exception as e:
+            job.add_error(str(e))
+            job.status = "failed"
+            print(f"Ingestion job {job.id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the history limit."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[: max(len(self.jobs) - self.history, 0)]:
+            del self.jobs[job_id]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,123 @@
+import os
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, List, Set, Tuple
+from langchain_core.prompts.prompt import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+# Recent turns passed verbatim to the condense prompt; older ones live in the summary
+MEMORY_WINDOW_TURNS = int(os.getenv("MEMORY_WINDOW_TURNS", "4"))
+# Sessions kept in memory (least recently used are evicted)
+MEMORY_MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", "1000"))
+# Older turns loaded from Postgres to seed the summary when a session is reloaded
+MEMORY_RELOAD_TURNS = int(os.getenv("MEMORY_RELOAD_TURNS", "12"))
+MEMORY_SUMMARY_MAX_WORDS = int(os.getenv("MEMORY_SUMMARY_MAX_WORDS", "150"))
+
+SUMMARY_PROMPT = PromptTemplate.from_template(
+    """Progressively summarize the lines of conversation provided, adding onto the previous summary and returning a new summary.
+Keep the facts, names and open questions a follow-up question might refer to, in at most {max_words} words.
+Current summary:
+{summary}
+New lines of conversation:
+{new_lines}
+New summary:"""
+)
+
+
+class SessionMemory:
+    """Recent turns plus a rolling summary of everything older."""
+
+    def __init__(self, turns: List[Tuple[str, str]], window: int):
+        self.turns = deque(turns[-window:], maxlen=window)
+        self.pending: List[Tuple[str, str]] = list(turns[:-window]) if len(turns) > window else []
+        self.summary = ""
+        self.summarizing = False
+        self.lock = threading.Lock()
+
+
+class ConversationMemory:
+    """Bounded, per-session conversation state backed by the chat transcript.
+
+    Sessions belong to a user: state is keyed by (user id, session id), so
+    a session id sent by another user never reaches someone else's turns.
+    `load_turns(user_id, session_id, limit)` is a coroutine returning up to
+    `limit` most recent (question, answer) pairs, oldest first; it is only
+    awaited when a session is not cached. Turns leaving the window are folded into
+    the summary with one LLM call in a background task, so the condense
+    prompt stays the same size however long the conversation gets.
+    """
+
+    def __init__(
+        self,
+        load_turns: Callable[[str, str, int], Awaitable[List[Tuple[str, str]]]],
+        window: int = MEMORY_WINDOW_TURNS,
+        max_sessions: int = MEMORY_MAX_SESSIONS,
+    ):
+        self.load_turns = load_turns
+        self.window = window
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[Tuple[str, str], SessionMemory]" = OrderedDict()
+        self.lock = threading.Lock()
+        # Strong references so pending summary tasks are not garbage collected
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def _session(self, user_id: str, session_id: str, llm) -> SessionMemory:
+        key = (user_id, session_id)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is not None:
+                self.sessions.move_to_end(key)
+                return session
+        turns = await self.load_turns(user_id, session_id, self.window + MEMORY_RELOAD_TURNS)
+        session = SessionMemory(turns, self.window)
+        with self.lock:
+            session = self.sessions.setdefault(key, session)
+            self.sessions.move_to_end(key)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        self._schedule_summary(session, llm)
+        return session
+
+    async def context(self, user_id: str, session_id: str, llm) -> Tuple[List[Tuple[str, str]], str]:
+        """Return the recent turns and the rolling summary of a user's session."""
+        session = await self._session(user_id, session_id, llm)
+        with session.lock:
+            return list(session.turns), session.summary
+
+    async def record(self, user_id: str, session_id: str, question: str, answer: str, llm):
+        session = await self._session(user_id, session_id, llm)
+        with session.lock:
+            if len(session.turns) == session.turns.maxlen:
+                session.pending.append(session.turns[0])
+            session.turns.append((question, answer))
+        self._schedule_summary(session, llm)
+
+    def _schedule_summary(self, session: SessionMemory, llm):
+        with session.lock:
+            if session.summarizing or not session.pending:
+                return
+            session.summarizing = True
+        task = asyncio.create_task(self._fold(session, llm))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _fold(self, session: SessionMemory, llm):
+        """Fold pending turns into the summary until none are left."""
+        chain = SUMMARY_PROMPT | llm | StrOutputParser()
+        while True:
+            with session.lock:
+                pending, session.pending = session.pending, []
+                summary = session.summary
+                if not pending:
+                    session.summarizing = False
+                    return
+            new_lines = "\n".join(f"Human: {human}\nAI: {ai}" for human, ai in pending)
+            try:
+                summary = await chain.ainvoke(
+                    {"summary": summary, "new_lines": new_lines, "max_words": MEMORY_SUMMARY_MAX_WORDS}
+                )
+            except Exception as e:
+                print(f"Error updating conversation summary: {e}")
+            with session.lock:
+                session.summary = summary
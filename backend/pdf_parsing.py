@@ -0,0 +1,93 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+import pymupdf
+import pymupdf4llm
+from pymupdf4llm import IdentifyHeaders
+
+# Pages converted per task, and converter processes shared by every ingestion
+# job; kept to a fraction of the cores so /chat keeps CPU for embeddings, but
+# at least two on multi-core machines. 0 converts inline, without a pool
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "10"))
+_CPUS = os.cpu_count() or 1
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(max(2, _CPUS // 4) if _CPUS > 1 else 1)))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """The process pool shared by all PDF conversions, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawn keeps the heavy parent (models, drivers, threads) out of the workers
+            context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=max(1, PDF_WORKERS), mp_context=context)
+        return _pool
+
+
+def shutdown_pdf_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def convert_pages(pdf_path: str, pages: List[int], headers: IdentifyHeaders) -> str:
+    """Convert a page range to markdown (runs in a worker process).
+
+    `headers` is computed once for the whole document, so `#` levels are
+    consistent across ranges and section paths stay stable.
+    """
+    return pymupdf4llm.to_markdown(pdf_path, pages=pages, hdr_info=headers)
+
+
+def page_count(pdf_path: str) -> int:
+    with pymupdf.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def iter_pdf_markdown(
+    pdf_path: str,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+    workers: int = PDF_WORKERS,
+) -> Iterator[str]:
+    """Yield the markdown of a PDF one page range at a time, in page order.
+
+    Ranges are converted in the shared process pool with a bounded look-ahead window,
+    so the first pages reach the chunker while later ones are still being
+    converted and only a few ranges are ever held in memory. Even a single
+    worker converts ahead in its own process, overlapping extraction.
+    """
+    total = page_count(pdf_path)
+    ranges = [list(range(start, min(start + pages_per_task, total))) for start in range(0, total, pages_per_task)]
+    # Font-size to header-level mapping from the whole document
+    headers = IdentifyHeaders(pdf_path)
+    if len(ranges) <= 1 or workers < 1:
+        for pages in ranges:
+            yield convert_pages(pdf_path, pages, headers)
+        return
+
+    executor = get_pdf_pool()
+    pending = deque()
+    upcoming = iter(ranges)
+    try:
+        for pages in upcoming:
+            pending.append(executor.submit(convert_pages, pdf_path, pages, headers))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            markdown = pending.popleft().result()
+            next_pages = next(upcoming, None)
+            if next_pages is not None:
+                pending.append(executor.submit(convert_pages, pdf_path, next_pages, headers))
+            yield markdown
+    finally:
+        # Don't leave this file's look-ahead occupying the shared workers
+        for future in pending:
+            future.cancel()
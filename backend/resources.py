@@ -0,0 +1,198 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from neo4j import AsyncGraphDatabase, GraphDatabase
+from langchain.embeddings import HuggingFaceEmbeddings
+from langchain_community.graphs import Neo4jGraph
+from langchain_community.vectorstores import Neo4jVector
+from langchain_core.embeddings import Embeddings
+from caching import CachedEmbeddings
+from chunking import get_tokenizer
+from embedding_engine import EmbeddingEngine
+
+load_dotenv()
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "GeneralTextEmbeddingModel")
+# Serve embeddings through the micro-batching engine instead of HuggingFaceEmbeddings
+EMBEDDING_ENGINE_ENABLED = os.getenv("EMBEDDING_ENGINE_ENABLED", "true").lower() == "true"
+# Build the heavy resources in a background thread right after startup
+RESOURCE_WARMUP = os.getenv("RESOURCE_WARMUP", "true").lower() == "true"
+# Resources the warm-up builds, in order
+WARMUP_RESOURCES = ["driver", "graph", "embeddings", "vector_index", "tokenizer"]
+
+
+def embedding_model():
+    if EMBEDDING_ENGINE_ENABLED:
+        return EmbeddingEngine(EMBEDDING_MODEL_PATH)
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_PATH)
+
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings that resolve the shared model on first use.
+
+    `peek` returns the model if it is already built; the async path only
+    leaves the event loop when the model still has to be loaded.
+    """
+
+    def __init__(self, resolve: Callable[[], Embeddings], peek: Callable[[], Optional[Embeddings]]):
+        self.resolve = resolve
+        self.peek = peek
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.resolve().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.resolve().embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        embeddings = self.peek() or await asyncio.to_thread(self.resolve)
+        return await embeddings.aembed_query(text)
+
+
+class Resources:
+    """Process-wide models and database clients, each built once on first use.
+
+    Importing the app no longer loads gte-large or talks to Neo4j; the first
+    access to a property (or `warm`) builds it. Construction is guarded by a
+    per-resource lock, so concurrent first accesses share one instance.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, object] = {}
+        self.build_seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.locks: Dict[str, threading.Lock] = {}
+        self.locks_lock = threading.Lock()
+        self.warmup_thread: Optional[threading.Thread] = None
+        self.warmup_done = threading.Event()
+        self.warmup_hooks: List[Callable[[], None]] = []
+        # Cheap wrapper, usable before the model exists
+        self.query_embeddings = CachedEmbeddings(
+            LazyEmbeddings(lambda: self.embeddings, lambda: self.values.get("embeddings"))
+        )
+
+    def _get(self, name: str, factory: Callable[[], object]):
+        value = self.values.get(name)
+        if value is not None:
+            return value
+        with self.locks_lock:
+            lock = self.locks.setdefault(name, threading.Lock())
+        with lock:
+            value = self.values.get(name)
+            if value is None:
+                start = time.monotonic()
+                try:
+                    value = factory()
+                except Exception as e:
+                    self.errors[name] = str(e)
+                    raise
+                self.errors.pop(name, None)
+                self.build_seconds[name] = time.monotonic() - start
+                self.values[name] = value
+        return value
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._get("embeddings", embedding_model)
+
+    @property
+    def graph(self):
+        return self._get(
+            "graph", lambda: Neo4jGraph(url=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD)
+        )
+
+    @property
+    def driver(self):
+        return self._get("driver", lambda: GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)))
+
+    @property
+    def async_driver(self):
+        """Async Neo4j driver; first access should happen on the event loop."""
+        return self._get(
+            "async_driver", lambda: AsyncGraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+        )
+
+    @property
+    def vector_index(self):
+        # Ingestion writes embeddings for new Documents itself
+        return self._get(
+            "vector_index",
+            lambda: Neo4jVector.from_existing_graph(
+                self.query_embeddings,
+                search_type="hybrid",
+                node_label="Document",
+                text_node_properties=["text"],
+                embedding_node_property="embedding",
+            ),
+        )
+
+    @property
+    def tokenizer(self):
+        """Token counter for chunking and context packing; loaded here so no request pays for it."""
+        return self._get("tokenizer", get_tokenizer)
+
+    def on_warm(self, hook: Callable[[], None]):
+        """Run `hook` at the end of the warm-up, before readiness is reported."""
+        self.warmup_hooks.append(hook)
+
+    def warm(self, names: List[str] = WARMUP_RESOURCES):
+        """Build the named resources and run the hooks, recording (not raising) failures."""
+        try:
+            for name in names:
+                try:
+                    getattr(self, name)
+                except Exception as e:
+                    print(f"Error warming up {name}: {e}")
+            for hook in self.warmup_hooks:
+                try:
+                    hook()
+                except Exception as e:
+                    print(f"Error in warm-up hook: {e}")
+        finally:
+            self.warmup_done.set()
+
+    def start_warmup(self):
+        """Warm up in a daemon thread so startup returns immediately."""
+        self.warmup_thread = threading.Thread(target=self.warm, name="resource-warmup", daemon=True)
+        self.warmup_thread.start()
+
+    def status(self) -> dict:
+        names = WARMUP_RESOURCES + ["async_driver"]
+        return {
+            name: {
+                "warm": name in self.values,
+                "build_seconds": self.build_seconds.get(name),
+                "error": self.errors.get(name),
+            }
+            for name in names
+        }
+
+    def ready(self) -> bool:
+        """Without warm-up, resources build on demand and the app is always ready."""
+        if not RESOURCE_WARMUP:
+            return True
+        return self.warmup_done.is_set() and all(name in self.values for name in WARMUP_RESOURCES)
+
+    def embedding_stats(self) -> Optional[dict]:
+        """Micro-batching and accuracy counters, once the engine is loaded."""
+        embeddings = self.values.get("embeddings")
+        return embeddings.stats() if isinstance(embeddings, EmbeddingEngine) else None
+
+    async def aclose(self):
+        embeddings = self.values.pop("embeddings", None)
+        if isinstance(embeddings, EmbeddingEngine):
+            embeddings.close()
+        driver = self.values.pop("driver", None)
+        if driver is not None:
+            driver.close()
+        async_driver = self.values.pop("async_driver", None)
+        if async_driver is not None:
+            await async_driver.close()
+
+
+resources = Resources()
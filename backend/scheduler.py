@@ -0,0 +1,206 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Callable, Iterable, List, Optional
+from groq import RateLimitError
+
+# Per-key Groq limits (defaults match the free tier for llama-3.1-8b-instant)
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_TOKENS_PER_MINUTE = int(os.getenv("GROQ_TOKENS_PER_MINUTE", "6000"))
+RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("RATE_LIMIT_BACKOFF_SECONDS", "5"))
+RATE_LIMIT_MAX_BACKOFF_SECONDS = float(os.getenv("RATE_LIMIT_MAX_BACKOFF_SECONDS", "120"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "8"))
+
+
+# Detect a 429 coming back from the Groq SDK (directly or chained by langchain).
+# Messages are not inspected: extraction errors can echo document text.
+def is_rate_limit_error(error: Exception) -> bool:
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, RateLimitError) or getattr(error, "status_code", None) == 429:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+# Read the server-provided retry hint, if any
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `capacity` per minute."""
+
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        """Block until `amount` tokens are available, then take them."""
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """Empty the bucket, e.g. after the server reported a 429."""
+        with self.lock:
+            self._refill()
+            self.tokens = 0.0
+
+
+class KeyState:
+    """Rate-limit bookkeeping for a single API key."""
+
+    def __init__(self, api_key: str, requests_per_minute: int, tokens_per_minute: int):
+        self.api_key = api_key
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.failures = 0
+        self.completed = 0
+
+    def wait_for_capacity(self, estimated_tokens: int):
+        self.requests.acquire(1)
+        self.tokens.acquire(estimated_tokens)
+
+    def back_off(self, error: Exception) -> float:
+        """Pause only this key; the delay grows with consecutive 429s."""
+        self.failures += 1
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = min(
+                RATE_LIMIT_BACKOFF_SECONDS * (2 ** (self.failures - 1)),
+                RATE_LIMIT_MAX_BACKOFF_SECONDS,
+            )
+        self.requests.drain()
+        self.tokens.drain()
+        return delay
+
+    def succeeded(self):
+        self.failures = 0
+        self.completed += 1
+
+
+class ExtractionScheduler:
+    """Run work items across all API keys at once, each key within its own limits.
+
+    One worker thread is started per key. Workers pull items from a shared
+    iterator, so throughput scales with the number of configured keys. A 429
+    puts the item back at the front of the queue and backs off that key only,
+    while the other keys keep working.
+    """
+
+    def __init__(
+        self,
+        api_keys: List[str],
+        requests_per_minute: int = GROQ_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = GROQ_TOKENS_PER_MINUTE,
+        max_retries: int = RATE_LIMIT_MAX_RETRIES,
+    ):
+        if not api_keys:
+            raise ValueError("At least one API key is required.")
+        self.keys = [KeyState(key, requests_per_minute, tokens_per_minute) for key in api_keys]
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.retries = deque()
+        self.items = None
+        self.failure: Optional[Exception] = None
+
+    def _next_item(self):
+        with self.lock:
+            if self.retries:
+                return self.retries.popleft()
+            try:
+                return (next(self.items), 0)
+            except StopIteration:
+                return None
+            except Exception as e:
+                # The item source itself broke (e.g. a parse error): stop every worker
+                self.failure = e
+                self.items = iter(())
+                return None
+
+    def push(self, *items):
+        """Put follow-up items at the front of the queue (e.g. a split batch)."""
+        with self.lock:
+            for item in reversed(items):
+                self.retries.appendleft((item, 0))
+
+    def _worker(
+        self,
+        key: KeyState,
+        handler: Callable[[str, object], None],
+        estimate_tokens: Callable[[object], int],
+        on_error: Optional[Callable[[object, Exception], None]],
+    ):
+        while True:
+            entry = self._next_item()
+            if entry is None:
+                return
+            item, attempts = entry
+            estimated_tokens = estimate_tokens(item)
+            # Items that make no LLM call (e.g. fully cached) skip rate limiting
+            if estimated_tokens:
+                key.wait_for_capacity(estimated_tokens)
+            try:
+                handler(key.api_key, item)
+                key.succeeded()
+            except Exception as e:
+                if is_rate_limit_error(e) and attempts < self.max_retries:
+                    delay = key.back_off(e)
+                    print(f"Rate limited on key #{self.keys.index(key) + 1}, backing off {delay:.1f}s")
+                    with self.lock:
+                        self.retries.appendleft((item, attempts + 1))
+                    time.sleep(delay)
+                else:
+                    print(f"Error processing item: {e}")
+                    if on_error:
+                        on_error(item, e)
+
+    def run(
+        self,
+        items: Iterable,
+        handler: Callable[[str, object], None],
+        estimate_tokens: Callable[[object], int] = lambda item: 1,
+        on_error: Optional[Callable[[object, Exception], None]] = None,
+    ):
+        """Call `handler(api_key, item)` for every item and wait for completion.
+
+        Items that still fail after retries are reported to `on_error`. An
+        exception raised by the item source is re-raised once workers stop.
+        """
+        self.items = iter(items)
+        self.retries.clear()
+        self.failure = None
+        workers = [
+            threading.Thread(target=self._worker, args=(key, handler, estimate_tokens, on_error), daemon=True)
+            for key in self.keys
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if self.failure is not None:
+            raise self.failure
@@ -0,0 +1,156 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import List, Optional
+import numpy as np
+from caching import GraphGeneration, graph_generation
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.sqlite3")
+# Cosine similarity a previous question needs to reuse its answer
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class SemanticCache:
+    """Reuse answers of previously answered questions that mean the same thing.
+
+    Questions are embedded and compared by cosine similarity against the
+    stored questions for the same model. Entries persist in SQLite and are
+    held in memory as one matrix for search. The cache keeps its own
+    persistent generation number, advanced whenever the graph generation is
+    bumped, and drops all answers at that point so none outlive a data change.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        path: str = SEMANTIC_CACHE_PATH,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        generation: GraphGeneration = graph_generation,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                generation INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0)")
+        self.conn.commit()
+        self.generation = self.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+        self._load()
+        generation.on_bump(self.invalidate)
+
+    def _load(self):
+        rows = self.conn.execute(
+            "SELECT id, model, answer, embedding, last_access FROM answers WHERE generation = ?",
+            (self.generation,),
+        ).fetchall()
+        self.ids = [row[0] for row in rows]
+        self.models = [row[1] for row in rows]
+        self.answers = [row[2] for row in rows]
+        self.last_access = [row[4] for row in rows]
+        self.matrix = (
+            np.vstack([np.frombuffer(row[3], dtype=np.float32) for row in rows]) if rows else None
+        )
+
+    def lookup(self, question: str, model: str) -> Optional[str]:
+        vector = _unit(self.embeddings.embed_query(question))
+        with self.lock:
+            if self.matrix is not None:
+                scores = self.matrix @ vector
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    if self.models[i] == model:
+                        self.hits += 1
+                        self.last_access[i] = time.time()
+                        self.conn.execute(
+                            "UPDATE answers SET last_access = ? WHERE id = ?", (self.last_access[i], self.ids[i])
+                        )
+                        self.conn.commit()
+                        return self.answers[i]
+            self.misses += 1
+        return None
+
+    def store(self, question: str, model: str, answer: str, generation: Optional[int] = None):
+        """Remember an answer; skipped if the graph changed since `generation` was read."""
+        vector = _unit(self.embeddings.embed_query(question))
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            now = time.time()
+            cursor = self.conn.execute(
+                "INSERT INTO answers (generation, model, question, answer, embedding, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.generation, model, question, answer, vector.tobytes(), now),
+            )
+            self.ids.append(cursor.lastrowid)
+            self.models.append(model)
+            self.answers.append(answer)
+            self.last_access.append(now)
+            self.matrix = vector[None, :] if self.matrix is None else np.vstack([self.matrix, vector])
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop the least recently used answers beyond `max_entries`."""
+        excess = len(self.ids) - self.max_entries
+        if excess <= 0:
+            return
+        drop = set(np.argsort(self.last_access)[:excess].tolist())
+        self.conn.executemany("DELETE FROM answers WHERE id = ?", [(self.ids[i],) for i in drop])
+        keep = [i for i in range(len(self.ids)) if i not in drop]
+        self.ids = [self.ids[i] for i in keep]
+        self.models = [self.models[i] for i in keep]
+        self.answers = [self.answers[i] for i in keep]
+        self.last_access = [self.last_access[i] for i in keep]
+        self.matrix = self.matrix[keep] if keep else None
+
+    def current_generation(self) -> int:
+        with self.lock:
+            return self.generation
+
+    def invalidate(self):
+        """Advance the persisted generation and forget every stored answer."""
+        with self.lock:
+            self.generation += 1
+            self.conn.execute("UPDATE meta SET value = ? WHERE key = 'generation'", (self.generation,))
+            self.conn.execute("DELETE FROM answers")
+            self.conn.commit()
+            self._load()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.ids),
+                "hits": self.hits,
+                "misses": self.misses,
+                "generation": self.generation,
+                "threshold": self.threshold,
+            }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,132 @@
+import os
+import uuid
+import asyncio
+from datetime import datetime
+from typing import Optional
+from db import acquire
+
+# Rows written per COPY, and the longest a queued row waits for a batch to fill
+TRANSCRIPT_BATCH_SIZE = int(os.getenv("TRANSCRIPT_BATCH_SIZE", "200"))
+TRANSCRIPT_FLUSH_INTERVAL = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL", "1.0"))
+# Rows buffered in memory before the overflow policy applies
+TRANSCRIPT_MAX_BACKLOG = int(os.getenv("TRANSCRIPT_MAX_BACKLOG", "10000"))
+# "drop_oldest", "drop_newest" or "block" (wait for room, pushing back on requests)
+TRANSCRIPT_OVERFLOW = os.getenv("TRANSCRIPT_OVERFLOW", "drop_oldest")
+
+TRANSCRIPT_COLUMNS = ["user_id", "session_id", "question", "answer", "timestamp"]
+
+_STOP = object()
+
+
+class TranscriptLogger:
+    """Write-behind buffer for the chat transcript table.
+
+    `log` only enqueues the row; a background task drains the queue and
+    writes rows with one COPY per batch, once `batch_size` rows are waiting
+    or the oldest has waited `flush_interval` seconds. `close` writes
+    everything still queued before returning.
+    """
+
+    def __init__(
+        self,
+        table: str = "agentpro_db",
+        batch_size: int = TRANSCRIPT_BATCH_SIZE,
+        flush_interval: float = TRANSCRIPT_FLUSH_INTERVAL,
+        max_backlog: int = TRANSCRIPT_MAX_BACKLOG,
+        overflow: str = TRANSCRIPT_OVERFLOW,
+    ):
+        if overflow not in ("drop_oldest", "drop_newest", "block"):
+            raise ValueError(f"Unknown transcript overflow policy: {overflow}")
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.overflow = overflow
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    async def start(self):
+        # One slot beyond the backlog is reserved for the stop marker
+        self.queue = asyncio.Queue(maxsize=self.max_backlog + 1)
+        self.task = asyncio.create_task(self._run())
+
+    async def log(self, user_id: str, session_id: str, question: str, answer: str):
+        """Queue one transcript row; never waits on PostgreSQL."""
+        if self.closed or self.queue is None:
+            self.dropped += 1
+            return
+        row = (uuid.UUID(user_id), uuid.UUID(session_id), question, answer, datetime.now())
+        if self.queue.qsize() < self.max_backlog:
+            self.queue.put_nowait(row)
+        elif self.overflow == "block":
+            while self.queue.qsize() >= self.max_backlog and not self.closed:
+                await asyncio.sleep(self.flush_interval / 10)
+            if self.closed:
+                self.dropped += 1
+            else:
+                self.queue.put_nowait(row)
+        elif self.overflow == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(row)
+            self.dropped += 1
+        else:
+            self.dropped += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+            if stop:
+                return
+
+    async def _write(self, rows):
+        try:
+            async with acquire() as conn:
+                await conn.copy_records_to_table(self.table, records=rows, columns=TRANSCRIPT_COLUMNS)
+            self.written += len(rows)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(rows)
+            print(f"Error writing {len(rows)} transcript rows: {e}")
+
+    async def close(self):
+        """Stop accepting rows and flush the remaining backlog."""
+        if self.task is None or self.closed:
+            return
+        self.closed = True
+        self.queue.put_nowait(_STOP)
+        await self.task
+
+    def stats(self) -> dict:
+        return {
+            "backlog": self.queue.qsize() if self.queue else 0,
+            "max_backlog": self.max_backlog,
+            "overflow": self.overflow,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
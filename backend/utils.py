@@ -1,4 +1,5 @@
 import os
+import asyncio
 import warnings
 from typing import Tuple, List
 from langchain_core.runnables import (
@@ -10,11 +11,16 @@ from langchain_core.runnables import (
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.prompts.prompt import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+from caching import graph_generation, retrieval_cache
+from context_assembler import assemble_context
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+# Per-branch retrieval timeouts (seconds)
+STRUCTURED_RETRIEVAL_TIMEOUT = float(os.getenv("STRUCTURED_RETRIEVAL_TIMEOUT", "8"))
+VECTOR_RETRIEVAL_TIMEOUT = float(os.getenv("VECTOR_RETRIEVAL_TIMEOUT", "5"))
+
 
 # Define the Entities model
 class Entities(BaseModel):
@@ -40,71 +46,194 @@ def generate_full_text_query(input: str) -> str:
     full_text_query += f" {words[-1]}~2"
     return full_text_query.strip()
 
-# Structured retrieval function
-def structured_retriever(question: str, graph, entity_chain) -> str:
-    result = ""
+# Full-text hits per entity, neighborhood lines kept per entity, and lines overall
+ENTITY_MATCH_LIMIT = int(os.getenv("ENTITY_MATCH_LIMIT", "2"))
+ENTITY_NEIGHBOR_LIMIT = int(os.getenv("ENTITY_NEIGHBOR_LIMIT", "50"))
+STRUCTURED_RESULT_LIMIT = int(os.getenv("STRUCTURED_RESULT_LIMIT", "100"))
+
+# Resolve every entity in one round trip; duplicates across entities collapse server-side
+STRUCTURED_QUERY = """
+UNWIND $queries AS query
+CALL db.index.fulltext.queryNodes('entity', query, {limit: $match_limit})
+YIELD node, score
+CALL {
+  WITH node
+  MATCH (node)-[r:!MENTIONS]->(neighbor)
+  RETURN node.id + ' - ' + type(r) + ' -> ' + neighbor.id AS output
+  UNION ALL
+  WITH node
+  MATCH (node)<-[r:!MENTIONS]-(neighbor)
+  RETURN neighbor.id + ' - ' + type(r) + ' -> ' +  node.id AS output
+}
+WITH query, output, max(score) AS score
+ORDER BY score DESC
+WITH query, collect({output: output, score: score})[..$entity_limit] AS rows
+UNWIND rows AS row
+WITH row.output AS output, max(row.score) AS score
+ORDER BY score DESC
+LIMIT $limit
+RETURN output
+"""
+
+# Chunks returned by the vector branch (Neo4jVector's default k)
+VECTOR_RESULT_LIMIT = int(os.getenv("VECTOR_RESULT_LIMIT", "4"))
+
+# Neo4jVector's hybrid search (vector and keyword hits, each normalized to its
+# best score), run on the async driver; the index's own retrieval query follows
+HYBRID_SEARCH_QUERY = """
+CALL {
+  CALL db.index.vector.queryNodes($index, $k, $embedding) YIELD node, score
+  WITH collect({node: node, score: score}) AS nodes, max(score) AS max
+  UNWIND nodes AS n
+  RETURN n.node AS node, (n.score / max) AS score
+  UNION
+  CALL db.index.fulltext.queryNodes($keyword_index, $query, {limit: $k}) YIELD node, score
+  WITH collect({node: node, score: score}) AS nodes, max(score) AS max
+  UNWIND nodes AS n
+  RETURN n.node AS node, (n.score / max) AS score
+}
+WITH node, max(score) AS score ORDER BY score DESC LIMIT $k
+"""
+
+class RetrievalStatus:
+    """Passed with a chat request; retrieval clears `complete` if a branch timed out or failed."""
+
+    def __init__(self):
+        self.complete = True
+
+# Structured retrieval over the async Neo4j driver: neighborhood lines of the entities in the question
+async def astructured_retriever(question: str, async_driver, entity_chain, entity_matcher=None) -> List[str]:
+    # Off the event loop: matching may wait briefly behind an index update
+    names = await asyncio.to_thread(entity_matcher.match, question) if entity_matcher is not None else []
+    if not names:
+        names = (await entity_chain.ainvoke({"question": question})).names
+    queries = [generate_full_text_query(entity) for entity in names if remove_lucene_chars(entity).strip()]
+    if not queries:
+        return []
+    records, _, _ = await async_driver.execute_query(
+        STRUCTURED_QUERY,
+        {
+            "queries": queries,
+            "match_limit": ENTITY_MATCH_LIMIT,
+            "entity_limit": ENTITY_NEIGHBOR_LIMIT,
+            "limit": STRUCTURED_RESULT_LIMIT,
+        },
+    )
+    return [record["output"] for record in records]
+
+# Hybrid similarity search over the async Neo4j driver; `vector_index` only
+# supplies the query embedding, the index names and the retrieval query
+async def avector_retriever(question: str, async_driver, vector_index) -> List[str]:
+    embedding = await vector_index.embedding.aembed_query(question)
+    records, _, _ = await async_driver.execute_query(
+        HYBRID_SEARCH_QUERY + vector_index.retrieval_query,
+        {
+            "index": vector_index.index_name,
+            "keyword_index": vector_index.keyword_index_name,
+            "k": VECTOR_RESULT_LIMIT,
+            "embedding": embedding,
+            "query": remove_lucene_chars(question),
+        },
+    )
+    return [record["text"] for record in records]
+
+# Await a branch up to its timeout; a slow or failed branch contributes nothing
+async def _abranch_result(awaitable, timeout: float, name: str, default):
     try:
-        entities = entity_chain.invoke({"question": question})
-        for entity in entities.names:
-            response = graph.query(
-                """CALL db.index.fulltext.queryNodes('entity', $query, {limit:2})
-                YIELD node,score
-                CALL {
-                  WITH node
-                  MATCH (node)-[r:!MENTIONS]->(neighbor)
-                  RETURN node.id + ' - ' + type(r) + ' -> ' + neighbor.id AS output
-                  UNION ALL
-                  WITH node
-                  MATCH (node)<-[r:!MENTIONS]-(neighbor)
-                  RETURN neighbor.id + ' - ' + type(r) + ' -> ' +  node.id AS output
-                }
-                RETURN output LIMIT 50
-                """,
-                {"query": generate_full_text_query(entity)},
-            )
-            result += "\n".join([el['output'] for el in response])
+        return await asyncio.wait_for(awaitable, timeout), True
     except Exception as e:
-        result += f"Error in structured retrieval: {e}"
-    return result
-
-# Define retriever function
-def retriever(question: str, graph, entity_chain, vector_index):
-    structured_data = structured_retriever(question, graph, entity_chain)
-    unstructured_data = [el.page_content for el in vector_index.similarity_search(question)]
-    final_data = f"""Structured data:
-    {structured_data}
-    Unstructured data:
-    {"#Document ".join(unstructured_data)}
-    """
-    return final_data
-
-# Define question handling and answer generation function
-def Chat(graph, llm, embedding, vector_index, question):
-    # Initialize components
-    entity_chain = create_prompt_template() | llm.with_structured_output(Entities)
-
-    # Condense a chat history and follow-up question into a standalone question
-    _template = """Given the following conversation and a follow-up question, rephrase the follow-up question to be a standalone question,
-    in its original language.
-    Chat History:
-    {chat_history}
-    Follow-Up Input: {question}
-    Standalone question:"""  # noqa: E501
-    CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template(_template)
-
-    # Condense chat history and follow-up question if chat history exists
-    def _format_chat_history(chat_history: List[Tuple[str, str]]) -> List:
-        buffer = []
-        for human, ai in chat_history:
-            buffer.append(HumanMessage(content=human))
-            buffer.append(AIMessage(content=ai))
-        return buffer
+        print(f"{name} retrieval skipped: {e.__class__.__name__} {e}")
+        return default, False
+
+# Fetch structured lines and similar chunks; both branches are awaited concurrently
+async def aretrieve(question: str, async_driver, entity_chain, vector_index, entity_matcher=None, status=None) -> Tuple[List[str], List[str]]:
+    generation = graph_generation.value
+    cached = retrieval_cache.get(question)
+    if cached is not None:
+        return cached
+
+    (structured_data, structured_ok), (unstructured_data, vector_ok) = await asyncio.gather(
+        _abranch_result(
+            astructured_retriever(question, async_driver, entity_chain, entity_matcher),
+            STRUCTURED_RETRIEVAL_TIMEOUT, "Structured", [],
+        ),
+        _abranch_result(
+            avector_retriever(question, async_driver, vector_index),
+            VECTOR_RETRIEVAL_TIMEOUT, "Vector", [],
+        ),
+    )
+    # Only complete retrievals are worth repeating
+    if structured_ok and vector_ok:
+        retrieval_cache.set(question, (structured_data, unstructured_data), generation)
+    elif status is not None:
+        status.complete = False
+    return structured_data, unstructured_data
+
+def _packed_context(question: str, structured_data: List[str], unstructured_data: List[str], token_budget=None) -> str:
+    context = assemble_context(question, structured_data, unstructured_data, token_budget)
+    if context.items_dropped:
+        print(
+            f"Context: kept {context.items_used} items ({context.tokens_used} tokens), "
+            f"dropped {context.items_dropped} items ({context.tokens_dropped} tokens)"
+        )
+    return context.text
+
+# Retrieved items packed into the model's token budget
+async def aretriever(question: str, async_driver, entity_chain, vector_index, entity_matcher=None, token_budget=None, status=None):
+    structured_data, unstructured_data = await aretrieve(question, async_driver, entity_chain, vector_index, entity_matcher, status)
+    # Token counting is CPU work; keep it off the event loop
+    return await asyncio.to_thread(_packed_context, question, structured_data, unstructured_data, token_budget)
+
+# Condense a chat history and follow-up question into a standalone question
+_template = """Given the following conversation and a follow-up question, rephrase the follow-up question to be a standalone question,
+in its original language.
+Summary of the earlier conversation:
+{summary}
+Chat History:
+{chat_history}
+Follow-Up Input: {question}
+Standalone question:"""  # noqa: E501
+CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template(_template)
+
+# Build final prompt template
+template = """You are a customer support chatbot. Answer the question based only on the following context. Please understand the overall meaning of the question, even if there are spelling mistakes, and ensure that no negative words or sentences are used, like Unfortunately:
+{context}
+Question: {question}
+Use natural language and be concise.
+Answer:"""
+ANSWER_PROMPT = ChatPromptTemplate.from_template(template)
+
+ENTITY_PROMPT = create_prompt_template()
+
+
+# Condense chat history and follow-up question if chat history exists
+def _format_chat_history(chat_history: List[Tuple[str, str]]) -> str:
+    buffer = []
+    for human, ai in chat_history:
+        buffer.append(f"Human: {human}")
+        buffer.append(f"AI: {ai}")
+    return "\n".join(buffer)
+
+# Build the full RAG pipeline for one LLM; the result is reusable across requests.
+# The chain is async-only (ainvoke/astream): retrieval runs on the async Neo4j driver.
+def build_chain(llm, vector_index, async_driver, entity_matcher=None, token_budget=None):
+    entity_chain = ENTITY_PROMPT | llm.with_structured_output(Entities)
+
+    # Retrieval sees the search query plus the request's RetrievalStatus, if any
+    async def _aretrieve_context(x):
+        return await aretriever(
+            x["search_query"], async_driver, entity_chain, vector_index, entity_matcher, token_budget,
+            x.get("retrieval_status"),
+        )
+
+    retrieve_context = RunnableLambda(_aretrieve_context)
 
     _search_query = RunnableBranch(
         (
-            RunnableLambda(lambda x: bool(x.get("chat_history"))).with_config(run_name="HasChatHistoryCheck"),
+            RunnableLambda(lambda x: bool(x.get("chat_history") or x.get("summary"))).with_config(run_name="HasChatHistoryCheck"),
             RunnablePassthrough.assign(
-                chat_history=lambda x: _format_chat_history(x["chat_history"])
+                chat_history=lambda x: _format_chat_history(x.get("chat_history") or []),
+                summary=lambda x: x.get("summary") or "(none)",
             )
             | CONDENSE_QUESTION_PROMPT
             | llm
@@ -113,29 +242,32 @@ def Chat(graph, llm, embedding, vector_index, question):
         RunnableLambda(lambda x: x["question"]),
     )
 
-    # Build final prompt template
-    template = """You are a customer support chatbot. Answer the question based only on the following context. Please understand the overall meaning of the question, even if there are spelling mistakes, and ensure that no negative words or sentences are used, like Unfortunately:
-    {context}
-    Question: {question}
-    Use natural language and be concise.
-    Answer:"""
-    prompt = ChatPromptTemplate.from_template(template)
-
     chain = (
         RunnableParallel(
             {
-                "context": _search_query | (lambda q: retriever(q, graph, entity_chain, vector_index)),
-                "question": RunnablePassthrough(),
+                "context": RunnablePassthrough.assign(search_query=_search_query) | retrieve_context,
+                "question": lambda x: x["question"],
             }
         )
-        | prompt
+        | ANSWER_PROMPT
         | llm
         | StrOutputParser()
     )
+    return chain
 
-    # Invoke the chain and return the response
+def _chat_input(question, chat_history, summary, status):
+    return {"question": question, "chat_history": chat_history or [], "summary": summary, "retrieval_status": status}
+
+# Question handling and answer generation used by the /chat endpoints.
+# Pass a RetrievalStatus as `status` to learn whether retrieval was complete.
+async def AChat(chain, question, chat_history=None, summary="", status=None):
     try:
-        response = chain.invoke({"question": question})
+        response = await chain.ainvoke(_chat_input(question, chat_history, summary, status))
     except Exception as e:
         response = f"Error: {e}"
-    return response
\ No newline at end of file
+    return response
+
+# Stream the answer token by token; the caller reports errors to the client
+async def AStreamChat(chain, question, chat_history=None, summary="", status=None):
+    async for token in chain.astream(_chat_input(question, chat_history, summary, status)):
+        yield token
@@ -1,4 +1,6 @@
 import os
+import json
+import time
 import requests
 import streamlit as st
 from dotenv import load_dotenv
@@ -170,17 +172,38 @@ def send_message(user_input):
             "Authorization": f"Bearer {st.session_state.auth_token}"
         }
 
+        # Show the question right away, then render the answer as tokens arrive
+        st.markdown(f'<div class="message user-message">🧑‍💻 {user_input}</div>', unsafe_allow_html=True)
+        placeholder = st.empty()
+        bot_response = ""
+
         try:
-            response = requests.post(f"{API_URL}/chat", 
-                                  json=payload, 
-                                  params=params,
-                                  headers=headers)
-            if response.status_code == 200:
-                data = response.json()
-                bot_response = data["response"]
+            with requests.post(f"{API_URL}/chat/stream",
+                               json=payload,
+                               params=params,
+                               headers=headers,
+                               stream=True) as response:
+                if response.status_code != 200:
+                    st.error(f"Error: {response.json()['detail']}")
+                else:
+                    event = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("event: "):
+                            event = line[len("event: "):]
+                        elif line.startswith("data: "):
+                            data = json.loads(line[len("data: "):])
+                            if event == "error":
+                                st.error(f"Error: {data['detail']}")
+                            elif event == "done":
+                                # Keep the session so follow-up questions have context
+                                st.session_state.session_id = data["session_id"]
+                            else:
+                                bot_response += data["token"]
+                                placeholder.markdown(f'<div class="message bot-message">🤖 {bot_response}</div>', unsafe_allow_html=True)
+                        elif not line:
+                            event = None
+            if bot_response:
                 st.session_state.messages.append({"role": "bot", "content": bot_response})
-            else:
-                st.error(f"Error: {response.json()['detail']}")
         except Exception as e:
             st.error(f"Request failed: {e}")
         finally:
@@ -189,7 +212,7 @@ def send_message(user_input):
 
 def process_file(file, code):
     try:
-        with st.spinner("Processing file..."):
+        with st.spinner("Uploading file..."):
             files = {"file": (file.name, file.getvalue())}
             data = {"code": code} if code else {}
             headers = {
@@ -202,10 +225,31 @@ def process_file(file, code):
                 headers=headers
             )
 
-            if response.status_code == 200:
-                st.success(response.json().get("message", "File processed successfully!"))
-            else:
-                st.error(f"Error: {response.json().get('detail', 'Unknown error')}")
+        if response.status_code != 200:
+            st.error(f"Error: {response.json().get('detail', 'Unknown error')}")
+            return
+
+        # Poll the background job until it finishes
+        job_id = response.json()["job_id"]
+        progress_bar = st.progress(0.0)
+        status_text = st.empty()
+        while True:
+            job = requests.get(f"{API_URL}/process/{job_id}", headers=headers).json()
+            done, total = job["chunks_done"], job["chunks_total"]
+            if total:
+                progress_bar.progress(min(done / total, 1.0))
+            eta = f", ETA {job['eta_seconds']:.0f}s" if job.get("eta_seconds") else ""
+            status_text.text(f"{job['status'].capitalize()}: {done}/{total or '?'} chunks{eta}")
+            if job["status"] in ("completed", "failed"):
+                break
+            time.sleep(2)
+
+        if job["status"] == "completed" and not job["error_count"]:
+            st.success("File processed successfully!")
+        elif job["status"] == "completed":
+            st.warning(f"File processed with {job['error_count']} error(s): {'; '.join(job['errors'])}")
+        else:
+            st.error(f"Error: {'; '.join(job['errors']) or 'Unknown error'}")
     except Exception as e:
         st.error(f"Request failed: {e}")
 